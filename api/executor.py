@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Bounded pool of worker threads that runs the quality tests out of the event loop.
+# At most max_workers test runs are executed at the same time and at most max_queue
+# more are waiting for a worker, the following ones are rejected at once instead of
+# piling up. Threads are used (and not processes) so that all the runs share the
+# caches of the process: HTTP client, validators, $ref documents and properties database.
+# SingleFlight runs only once the identical calls submitted while the first one is in progress.
+
+from asyncio import wrap_future, shield
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import BoundedSemaphore, Lock
+
+
+class ExecutorFullError(Exception):
+    """
+    All the workers are busy and the queue is full
+    """
+
+
+class BoundedExecutor:
+    def __init__(self, max_workers: int = 4, max_queue: int = 16):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qtest")
+
+        # one slot per running or queued task
+        self.slots = BoundedSemaphore(max_workers + max_queue)
+
+        self.lock = Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Schedule fn(*args, **kwargs) in a worker thread. Raise ExecutorFullError if there is no free slot.
+        """
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise ExecutorFullError(f"{self.max_workers} tests running and {self.max_queue} waiting")
+
+        with self.lock:
+            self.pending += 1
+
+        try:
+            future = self.executor.submit(self.execute, fn, *args, **kwargs)
+        except RuntimeError:
+            # the executor was shut down
+            self.release()
+            raise
+
+        future.add_done_callback(lambda _: self.release())
+
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) in a worker thread and wait for its result without blocking the event loop
+        """
+        return await wrap_future(self.submit(fn, *args, **kwargs))
+
+    def execute(self, fn, *args, **kwargs):
+        with self.lock:
+            self.running += 1
+
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+
+    def release(self):
+        with self.lock:
+            self.pending -= 1
+
+        self.slots.release()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self.pending - self.running,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class SingleFlight:
+    def __init__(self, executor: BoundedExecutor):
+        self.executor = executor
+
+        # key -> Future of the call in progress
+        self.calls = dict()
+        self.lock = Lock()
+
+        self.coalesced = 0
+
+    def submit(self, key, fn, *args, **kwargs) -> Future:
+        """
+        Schedule fn(*args, **kwargs) in the executor, or return the Future of the call in progress with the same key.
+        Raise ExecutorFullError if there is no free slot for a new call.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+
+            future = self.executor.submit(fn, *args, **kwargs)
+            self.calls[key] = future
+
+        future.add_done_callback(lambda _: self.forget(key, future))
+
+        return future
+
+    async def run(self, key, fn, *args, **kwargs):
+        """
+        Wait for the result of the call with this key without blocking the event loop. A caller that goes away
+        does not cancel the call, the other callers are still waiting for it.
+        """
+        return await shield(wrap_future(self.submit(key, fn, *args, **kwargs)))
+
+    def forget(self, key, future: Future):
+        with self.lock:
+            if self.calls.get(key) is future:
+                self.calls.pop(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "in_flight": len(self.calls),
+                "coalesced": self.coalesced
+            }
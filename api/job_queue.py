@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Durable queue of the quality testing jobs, stored in a local SQLite database shared
+# by all the processes of the host. A worker claims a job with a lease that it renews
+# while the job runs. If the worker dies (crash, restart, uvicorn reload), its lease
+# expires and the job is queued again, up to max_attempts times.
+
+from json import dumps, loads
+from os import makedirs
+from os.path import dirname
+from threading import local
+from time import time
+from uuid import uuid4
+import sqlite3
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class SDMJobQueue:
+    def __init__(self, db_path: str, lease_seconds: float = 300, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        # sqlite3 connections cannot be shared between threads, each thread opens its own one
+        self.connections = local()
+
+        if dirname(db_path):
+            makedirs(dirname(db_path), exist_ok=True)
+
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                data_model TEXT NOT NULL,
+                mail TEXT,
+                tests INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                submitted REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                output TEXT,
+                error TEXT
+            )""")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority DESC, submitted)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (data_model, tests, state)")
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.connections, "connection", None)
+        if connection is None:
+            # autocommit mode, the transactions are opened explicitly
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self.connections.connection = connection
+
+        return connection
+
+    def enqueue(self, data_model: str, mail: str, tests: int, priority: int = 0) -> str:
+        job_id = uuid4().hex
+
+        self.connection().execute(
+            "INSERT INTO jobs (id, priority, state, data_model, mail, tests, submitted) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, priority, QUEUED, data_model, mail, tests, time()))
+
+        return job_id
+
+    def enqueue_once(self, data_model: str, mail: str, tests: int, priority: int = 0,
+                     max_queued: int = None) -> [str, bool]:
+        """
+        Add a job unless the same tests of the same data model are already queued or running for the same mail,
+        whose output and progress files are named after it. Return the id of
+        the job and True if it was added, or the id of the existing job and False. The priority of an existing
+        queued job is raised to the given one. Return None and False if there are already max_queued jobs waiting.
+        """
+        connection = self.connection()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE data_model = ? AND tests = ? AND mail IS ? AND state IN (?, ?) "
+                "ORDER BY submitted LIMIT 1",
+                (data_model, tests, mail, QUEUED, RUNNING)).fetchone()
+
+            if row is not None:
+                connection.execute("UPDATE jobs SET priority = MAX(priority, ?) WHERE id = ? AND state = ?",
+                                   (priority, row["id"], QUEUED))
+                connection.execute("COMMIT")
+                return row["id"], False
+
+            if max_queued is not None and \
+                    connection.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0] >= max_queued:
+                connection.execute("COMMIT")
+                return None, False
+
+            job_id = self.enqueue(data_model=data_model, mail=mail, tests=tests, priority=priority)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return job_id, True
+
+    def claim(self, worker_id: str) -> [sqlite3.Row, None]:
+        """
+        Take the queued job with the highest priority (the oldest one first) and lease it to the worker.
+        The running jobs whose lease has expired are queued again before, or failed if they have already
+        been attempted max_attempts times.
+        """
+        connection = self.connection()
+        now = time()
+
+        # the write lock is taken at once, so that two workers cannot claim the same job
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE jobs SET state = ?, finished = ?, error = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, "The worker running the job stopped", RUNNING, now, self.max_attempts))
+
+            connection.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE state = ? AND lease_expires < ?",
+                (QUEUED, RUNNING, now))
+
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE state = ? ORDER BY priority DESC, submitted LIMIT 1", (QUEUED,)).fetchone()
+
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+
+            connection.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, started = ? "
+                "WHERE id = ?",
+                (RUNNING, worker_id, now + self.lease_seconds, now, row["id"]))
+
+            job = connection.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return job
+
+    def renew(self, job_id: str, worker_id: str, output: dict = None) -> bool:
+        """
+        Extend the lease of a running job and save its partial output. Return False if the worker lost the lease.
+        """
+        cursor = self.connection().execute(
+            "UPDATE jobs SET lease_expires = ?, output = COALESCE(?, output) "
+            "WHERE id = ? AND lease_owner = ? AND state = ?",
+            (time() + self.lease_seconds, dumps(output, default=str) if output is not None else None,
+             job_id, worker_id, RUNNING))
+
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, output: dict):
+        self.connection().execute(
+            "UPDATE jobs SET state = ?, finished = ?, output = ?, error = NULL, lease_owner = NULL, lease_expires = NULL "
+            "WHERE id = ? AND lease_owner = ?",
+            (SUCCEEDED, time(), dumps(output, default=str), job_id, worker_id))
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        """
+        Queue the job again if it has attempts left, otherwise mark it as failed
+        """
+        self.connection().execute(
+            "UPDATE jobs SET state = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+            "finished = CASE WHEN attempts < ? THEN NULL ELSE ? END, "
+            "error = ?, lease_owner = NULL, lease_expires = NULL "
+            "WHERE id = ? AND lease_owner = ?",
+            (self.max_attempts, QUEUED, FAILED, self.max_attempts, time(), error, job_id, worker_id))
+
+    def get(self, job_id: str) -> [sqlite3.Row, None]:
+        return self.connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def count(self, state: str) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)).fetchone()[0]
+
+    def purge(self, ttl_seconds: float):
+        """
+        Delete the jobs finished more than ttl_seconds ago
+        """
+        self.connection().execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+                                  (time() - ttl_seconds,))
+
+    def stats(self) -> dict:
+        rows = self.connection().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {state: count for state, count in rows}
+
+        return {
+            "database": self.db_path,
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "succeeded": counts.get(SUCCEEDED, 0),
+            "failed": counts.get(FAILED, 0),
+            "lease_seconds": self.lease_seconds,
+            "max_attempts": self.max_attempts
+        }
+
+    def close(self):
+        connection = getattr(self.connections, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.connections.connection = None
+
+
+def load_output(row: sqlite3.Row) -> [dict, None]:
+    return loads(row["output"]) if row["output"] is not None else None
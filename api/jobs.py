@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Quality test jobs: a job is submitted to the durable SDMJobQueue and runs in the
+# background in one of the worker threads of the process (or of another process sharing
+# the same queue), while the client polls its state, the output of the tests already
+# finished and finally its result. The finished jobs are kept for ttl_seconds.
+
+from datetime import datetime
+from os import getpid
+from threading import Thread, Condition, Event, Lock
+from api.executor import ExecutorFullError
+from api.job_queue import SDMJobQueue, load_output, RUNNING, SUCCEEDED, FAILED
+from smartdatamodels.master_tests import SDMQualityTesting
+from smartdatamodels.SDMEventBus import event_bus
+
+
+class Job:
+    def __init__(self, row, output: dict = None):
+        """
+        State of a job read from the queue, output is the partial output of the job if it is running in this process
+        """
+        self.id = row["id"]
+        self.state = row["state"]
+        self.data_model_repo_url = row["data_model"]
+        self.last_test_number = row["tests"]
+        self.priority = row["priority"]
+        self.attempts = row["attempts"]
+        self.submitted = datetime.fromtimestamp(row["submitted"])
+        self.started = datetime.fromtimestamp(row["started"]) if row["started"] else None
+        self.finished = datetime.fromtimestamp(row["finished"]) if row["finished"] else None
+        self.error = row["error"] if self.state == FAILED else None
+        self.output = output if output is not None else load_output(row)
+
+    def is_finished(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    @property
+    def result(self) -> [dict, None]:
+        return self.output if self.state == SUCCEEDED else None
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "data_model": self.data_model_repo_url,
+            "tests": self.last_test_number,
+            "priority": self.priority,
+            "attempts": self.attempts,
+            "submitted": str(self.submitted),
+            "started": str(self.started) if self.started else None,
+            "finished": str(self.finished) if self.finished else None,
+            "error": self.error,
+            "output": self.output if self.output is not None else dict()
+        }
+
+
+class JobManager:
+    def __init__(self, queue: SDMJobQueue, logger, max_workers: int = 4, max_queue: int = 100,
+                 ttl_seconds: float = 3600, poll_seconds: float = 1):
+        self.queue = queue
+        self.logger = logger
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.ttl_seconds = ttl_seconds
+        self.poll_seconds = poll_seconds
+
+        # job id -> (worker id, SDMQualityTesting) of the jobs running in this process
+        self.running = dict()
+        self.lock = Lock()
+
+        self.submitted = 0
+        self.coalesced = 0
+
+        # wakes up the workers of this process when a job is submitted
+        self.job_available = Condition()
+
+        # Create a stop event
+        self.__kill = Event()
+
+        self.workers = list()
+        self.heartbeat_thread = None
+
+    def start(self):
+        """
+        Start the worker threads, they resume the jobs left in the queue by a previous run of the process
+        """
+        if len(self.workers) > 0:
+            return
+
+        for number in range(self.max_workers):
+            worker_id = f"{getpid()}-{number}"
+            worker = Thread(target=self.work, args=(worker_id, self.__kill), name=f"job-worker-{number}")
+            worker.start()
+            self.workers.append(worker)
+
+        self.heartbeat_thread = Thread(target=self.heartbeat, args=(self.__kill,), name="job-heartbeat")
+        self.heartbeat_thread.start()
+
+    def submit(self, data_model_repo_url: str, mail: str, last_test_number: int, logger, priority: int = 0) -> Job:
+        """
+        Add a job to the queue, or return the job already queued or running with the same tests of the same data
+        model for the same mail. Raise ExecutorFullError if there are already max_queue jobs waiting.
+        """
+        self.queue.purge(self.ttl_seconds)
+
+        job_id, created = self.queue.enqueue_once(data_model=data_model_repo_url, mail=mail, tests=last_test_number,
+                                                  priority=priority, max_queued=self.max_queue)
+
+        if job_id is None:
+            raise ExecutorFullError(f"{self.max_queue} jobs waiting")
+
+        if not created:
+            with self.lock:
+                self.coalesced += 1
+
+            logger.info(f"Job '{job_id}' already submitted for the data model '{data_model_repo_url}'")
+
+            return self.get(job_id)
+
+        with self.lock:
+            self.submitted += 1
+
+        with self.job_available:
+            self.job_available.notify()
+
+        logger.info(f"Job '{job_id}' submitted for the data model '{data_model_repo_url}'")
+
+        return self.get(job_id)
+
+    def work(self, worker_id: str, event: Event):
+        while not event.is_set():
+            try:
+                row = self.queue.claim(worker_id)
+            except Exception as e:
+                self.logger.error(f"Unable to claim a job: {e}")
+                row = None
+
+            if row is None:
+                with self.job_available:
+                    self.job_available.wait(self.poll_seconds)
+                continue
+
+            self.run(row, worker_id)
+
+        self.queue.close()
+
+    def run(self, row, worker_id: str):
+        job_id = row["id"]
+        self.logger.info(f"Job '{job_id}' started by the worker '{worker_id}', attempt {row['attempts']}")
+
+        # the progress of the job is published in the channel named after it
+        events = event_bus.channel(job_id)
+        events.publish("attempt", {"attempt": row["attempts"], "worker": worker_id})
+
+        try:
+            quality_testing = SDMQualityTesting(data_model_repo_url=row["data_model"],
+                                                mail=row["mail"],
+                                                last_test_number=row["tests"],
+                                                logger=self.logger,
+                                                events=events)
+
+            with self.lock:
+                self.running[job_id] = (worker_id, quality_testing)
+
+            output = quality_testing.do_tests()
+            self.queue.complete(job_id, worker_id, output)
+            events.close({"state": SUCCEEDED})
+        except Exception as e:
+            self.logger.error(f"Job '{job_id}' failed: {e}")
+            self.queue.fail(job_id, worker_id, str(e))
+
+            # the job is queued again while it has attempts left
+            job = self.queue.get(job_id)
+            if job is None or job["state"] == FAILED:
+                events.close({"state": FAILED, "error": str(e)})
+            else:
+                events.publish("retry", {"attempt": row["attempts"], "error": str(e)})
+        finally:
+            with self.lock:
+                self.running.pop(job_id, None)
+
+    def heartbeat(self, event: Event):
+        """
+        Renew the leases of the jobs running in this process and save their partial output
+        """
+        while not event.wait(self.queue.lease_seconds / 3):
+            with self.lock:
+                running = list(self.running.items())
+
+            for job_id, (worker_id, quality_testing) in running:
+                try:
+                    self.queue.renew(job_id, worker_id, dict(quality_testing.output))
+                except Exception as e:
+                    self.logger.error(f"Unable to renew the lease of the job '{job_id}': {e}")
+
+            try:
+                self.close_finished_channels()
+            except Exception as e:
+                self.logger.error(f"Unable to close the channels of the finished jobs: {e}")
+
+        self.queue.close()
+
+    def close_channel(self, job_id: str, job: [Job, None]) -> dict:
+        """
+        Publish the "end" event of a job finished out of this process (or expired) in its channel, return its data
+        """
+        data = {"state": job.state if job is not None else "expired", "error": job.error if job is not None else None}
+
+        event_bus.close(job_id, data)
+
+        return data
+
+    def close_finished_channels(self):
+        """
+        Close the channels of the jobs queued again and finished by another process, which does not publish
+        its events here, so that their subscribers receive the "end" event
+        """
+        with self.lock:
+            running = set(self.running)
+
+        for job_id in event_bus.open_channels():
+            if job_id in running:
+                continue
+
+            job = self.get(job_id)
+            if job is None or job.is_finished():
+                self.close_channel(job_id, job)
+
+    def get(self, job_id: str) -> [Job, None]:
+        row = self.queue.get(job_id)
+        if row is None:
+            return None
+
+        with self.lock:
+            running = self.running.get(job_id)
+
+        # the output of a job running in this process is more recent than the one saved in the queue
+        if running is not None and row["state"] == RUNNING:
+            return Job(row, output=dict(running[1].output))
+
+        return Job(row)
+
+    def stats(self) -> dict:
+        with self.lock:
+            running_here = len(self.running)
+            submitted = self.submitted
+            coalesced = self.coalesced
+
+        return dict(self.queue.stats(),
+                    workers=self.max_workers,
+                    running_here=running_here,
+                    max_queue=self.max_queue,
+                    submitted=submitted,
+                    coalesced=coalesced,
+                    ttl_seconds=self.ttl_seconds)
+
+    def shutdown(self):
+        """
+        Stop the workers once their running jobs are finished, the queued jobs stay in the queue
+        """
+        self.__kill.set()
+
+        with self.job_available:
+            self.job_available.notify_all()
+
+        for worker in self.workers:
+            worker.join()
+
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+
+        self.logger.debug("JobManager::Threads have been stopped.")
@@ -21,10 +21,14 @@
 ##
 
 from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.logger import logger as fastapi_logger
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from uvicorn import run
 from datetime import datetime
+from contextlib import asynccontextmanager
+from asyncio import to_thread, get_running_loop, Queue, wait_for, TimeoutError as AsyncTimeoutError
+from threading import active_count
 from cli.command import __version__
 from secure import (
     Server,
@@ -37,20 +41,49 @@ from secure import (
 )
 from logging import getLogger
 from api.custom_logging import CustomizeLogger
-from json import JSONDecodeError
-from common.config import CONFIG_DATA
+from api.executor import BoundedExecutor, SingleFlight, ExecutorFullError
+from api.jobs import JobManager
+from api.job_queue import SDMJobQueue
+from json import JSONDecodeError, dumps
+from os.path import join
+from common.config import CONFIG_DATA, CODE_HOME
 from smartdatamodels.master_tests import SDMQualityTesting
 from smartdatamodels.SDMLinks import SDMLinks
+from smartdatamodels.PC_exist_already import get_sdm_properties, stop_sdm_properties
+from smartdatamodels.SDMHttpClient import http_client
+from smartdatamodels.SDMValidatorCache import validator_cache
+from smartdatamodels.SDMRefStore import ref_store
+from smartdatamodels.SDMEventBus import event_bus
+from smartdatamodels.SDMResultCache import result_cache
 from re import match
 from ssl import SSLContext, PROTOCOL_TLS_SERVER
 
 
 initial_uptime = datetime.now()
+
+# seconds between two comments sent to keep open the streams of events
+EVENTS_KEEPALIVE_SECONDS = 15
 logger = getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # start loading the properties database shared by all the requests before the first one arrives
+    get_sdm_properties(logger=app.logger)
+
+    # resume the jobs left in the queue
+    job_manager.start()
+
+    yield
+
+    qtest_executor.shutdown()
+    job_manager.shutdown()
+    sdm_links.stop()
+    stop_sdm_properties()
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="SDM SQL Schema Generation", debug=False)
+    app = FastAPI(title="SDM SQL Schema Generation", debug=False, lifespan=lifespan)
     app.add_middleware(HTTPSRedirectMiddleware)
 
     customize_logger = CustomizeLogger.make_logger(config_data=CONFIG_DATA)
@@ -63,6 +96,22 @@ def create_app() -> FastAPI:
 application = create_app()
 sdm_links = SDMLinks(logger=application.logger)
 
+executor_config = CONFIG_DATA.get("executor", dict())
+qtest_executor = BoundedExecutor(max_workers=executor_config.get("max_workers", 4),
+                                 max_queue=executor_config.get("max_queue", 16))
+qtest_flights = SingleFlight(executor=qtest_executor)
+
+jobs_config = CONFIG_DATA.get("jobs", dict())
+job_queue = SDMJobQueue(db_path=jobs_config.get("database") or join(CODE_HOME, "mastercheck_output", "jobs.sqlite"),
+                        lease_seconds=jobs_config.get("lease_seconds", 300),
+                        max_attempts=jobs_config.get("max_attempts", 3))
+job_manager = JobManager(queue=job_queue,
+                         logger=application.logger,
+                         max_workers=jobs_config.get("max_workers", 4),
+                         max_queue=jobs_config.get("max_queue", 100),
+                         ttl_seconds=jobs_config.get("ttl_seconds", 3600),
+                         poll_seconds=jobs_config.get("poll_seconds", 1))
+
 
 @application.middleware("https")
 async def set_secure_headers(request, call_next):
@@ -102,6 +151,10 @@ async def set_secure_headers(request, call_next):
 
     await secure_headers.set_headers_async(response)
 
+    # the streams of events must not be cached by the proxies
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        response.headers["Cache-Control"] = "no-cache"
+
     return response
 
 
@@ -120,12 +173,228 @@ def getversion(request: Request):
     return data
 
 
+@application.get("/stats", status_code=status.HTTP_200_OK)
+def getstats(request: Request):
+    request.app.logger.info("GET /stats - Request statistics of the shared resources")
+
+    data = {
+        "threads": active_count(),
+        "properties": get_sdm_properties(logger=request.app.logger).stats(),
+        "links": sdm_links.stats(),
+        "executor": dict(qtest_executor.stats(), **qtest_flights.stats()),
+        "jobs": job_manager.stats(),
+        "http": http_client.stats(),
+        "validators": validator_cache.stats(),
+        "ref_store": ref_store.stats(),
+        "event_bus": event_bus.stats(),
+        "result_cache": result_cache.stats()
+    }
+
+    return data
+
+
+@application.get("/entities", status_code=status.HTTP_200_OK)
+def getentities(request: Request, response: Response, prefix: str = "", offset: int = 0, limit: int = 20):
+    request.app.logger.info(f"GET /entities - Search the entities starting with '{prefix}'")
+
+    if offset < 0 or not 0 < limit <= 100:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"message": "offset must be 0 or greater and limit must be between 1 and 100"}
+
+    result = sdm_links.search_entities(prefix=prefix, offset=offset, limit=limit)
+
+    if result is None:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"message": "The official list of data models is not available yet, please try again later"}
+
+    data = {
+        "prefix": prefix,
+        "offset": offset,
+        "limit": limit,
+        "total": result["total"],
+        "entities": result["entities"]
+    }
+
+    return data
+
+
 @application.post("/qtest", status_code=status.HTTP_200_OK)
 async def qtest(request: Request, response: Response):
     request.app.logger.info(f'POST /qtest - Quality Testing of a Data Model')
 
-    resp = dict()
+    params, resp = await read_quality_testing_request(request=request, response=response)
+    if params is None:
+        return resp
+
+    # the tests are run in a worker thread, so that the event loop keeps serving the other requests, and the
+    # identical requests received while they run wait for the same result. The mail is part of the key, the
+    # output and progress files of the run are named after it.
+    key = (params["data_model_repo_url"], params["last_test_number"], params["mail"])
+
+    try:
+        resp = await qtest_flights.run(key, run_quality_tests, logger=request.app.logger, **params)
+    except ExecutorFullError as e:
+        request.app.logger.error(f"Quality tests rejected, {e}")
+
+        resp = {
+            "message": "Too many quality tests in progress, please try again later"
+        }
+
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        response.headers["Retry-After"] = "30"
+        return resp
+
+    response.status_code = status.HTTP_200_OK
+
+    return resp
+
 
+@application.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def postjob(request: Request, response: Response):
+    request.app.logger.info(f'POST /jobs - Quality Testing job of a Data Model')
+
+    params, resp = await read_quality_testing_request(request=request, response=response)
+    if params is None:
+        return resp
+
+    # the jobs with a higher priority are run first
+    priority = (await request.json()).get("priority", 0)
+    if not isinstance(priority, int):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"message": "priority must be an integer"}
+
+    # the queue is a SQLite database which may be locked by another process, it is not waited for in the event loop
+    try:
+        job = await to_thread(job_manager.submit, logger=request.app.logger, priority=priority, **params)
+    except ExecutorFullError as e:
+        request.app.logger.error(f"Quality testing job rejected, {e}")
+
+        resp = {
+            "message": "Too many quality testing jobs in progress, please try again later"
+        }
+
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        response.headers["Retry-After"] = "30"
+        return resp
+
+    response.status_code = status.HTTP_202_ACCEPTED
+    response.headers["Location"] = f"/jobs/{job.id}"
+
+    return job.status()
+
+
+@application.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+def getjob(request: Request, response: Response, job_id: str):
+    request.app.logger.info(f"GET /jobs/{job_id} - Request the state of a Quality Testing job")
+
+    job = job_manager.get(job_id)
+
+    if job is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"message": f"The job '{job_id}' does not exist or it has expired"}
+
+    return job.status()
+
+
+@application.get("/jobs/{job_id}/result", status_code=status.HTTP_200_OK)
+def getjobresult(request: Request, response: Response, job_id: str):
+    request.app.logger.info(f"GET /jobs/{job_id}/result - Request the result of a Quality Testing job")
+
+    job = job_manager.get(job_id)
+
+    if job is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"message": f"The job '{job_id}' does not exist or it has expired"}
+
+    if not job.is_finished():
+        # the client polls again later
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers["Retry-After"] = "5"
+        return job.status()
+
+    if job.error is not None:
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return {"message": f"The job '{job_id}' failed: {job.error}"}
+
+    return job.result
+
+
+@application.get("/jobs/{job_id}/events", status_code=status.HTTP_200_OK)
+async def getjobevents(request: Request, response: Response, job_id: str):
+    request.app.logger.info(f"GET /jobs/{job_id}/events - Follow the progress of a Quality Testing job")
+
+    job = await to_thread(job_manager.get, job_id)
+
+    if job is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"message": f"The job '{job_id}' does not exist or it has expired"}
+
+    return StreamingResponse(stream_job_events(job),
+                             media_type="text/event-stream",
+                             headers={"X-Accel-Buffering": "no"})
+
+
+async def stream_job_events(job):
+    """
+    Server-Sent Events of a job: the events already published and then the new ones, until the "end" event
+    """
+    job_id = job.id
+    loop = get_running_loop()
+    events = Queue()
+
+    # called by the worker thread running the job
+    def callback(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    # the channel is created if the job has not started yet
+    event_bus.channel(job_id)
+    history = event_bus.subscribe(job_id, callback)
+
+    try:
+        for event in history or list():
+            yield format_event(event)
+            if event["type"] == "end":
+                return
+
+        while True:
+            # the job may have been run by another process (or before a restart), whose events are not
+            # published here, its end is taken from the queue
+            if job is None or job.is_finished():
+                yield format_event(end_event(job_id, job))
+                return
+
+            try:
+                event = await wait_for(events.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+            except AsyncTimeoutError:
+                job = await to_thread(job_manager.get, job_id)
+                yield ": keep-alive\n\n"
+                continue
+
+            yield format_event(event)
+            if event["type"] == "end":
+                return
+    finally:
+        event_bus.unsubscribe(job_id, callback)
+
+
+def end_event(job_id: str, job) -> dict:
+    """
+    Close the channel of a job finished out of this process, and return its "end" event
+    """
+    data = job_manager.close_channel(job_id, job)
+
+    return dict(data, id=0, type="end", time=datetime.now().isoformat())
+
+
+def format_event(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {dumps(event, default=str)}\n\n"
+
+
+async def read_quality_testing_request(request: Request, response: Response) -> [dict, dict]:
+    """
+    Read the payload of a quality testing request and resolve its data model. Return the parameters of
+    SDMQualityTesting, or None and the error message with the status code set in the response.
+    """
     try:
         req_info = await request.json()
     except JSONDecodeError:
@@ -137,7 +406,7 @@ async def qtest(request: Request, response: Response):
         }
 
         response.status_code = status.HTTP_400_BAD_REQUEST
-        return resp
+        return None, resp
 
     # url can be a complete url to the repository or an Entity Name,
     found, data = get_url_key(url=req_info["data_model"], logger=request.app.logger)
@@ -148,18 +417,47 @@ async def qtest(request: Request, response: Response):
         f'Request generate quality tests from Data Model:"{data}", tests:"{tests}", and email:"{email}"')
 
     if found == 'entity':
-        data = sdm_links.get_links(entity_name=data)
-        data = data['entity_repo_link']
+        # the list of data models may not be downloaded yet, it is waited for in a worker thread so
+        # that the event loop keeps serving the other requests
+        try:
+            links = await to_thread(sdm_links.get_links, entity_name=data,
+                                    timeout=CONFIG_DATA.get("links_timeout_seconds", 10))
+        except TimeoutError:
+            request.app.logger.error("The list of data models is not available")
+
+            resp = {
+                "message": "The official list of data models is not available yet, please try again later"
+            }
+
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return None, resp
+
+        if links is None:
+            resp = {
+                "message": f"The entity '{data}' is not in the official list of data models"
+            }
+
+            response.status_code = status.HTTP_404_NOT_FOUND
+            return None, resp
+
+        data = links['entity_repo_link']
+
+    params = {
+        "data_model_repo_url": data,
+        "mail": email,
+        "last_test_number": tests
+    }
 
-    sdm_quality_testing = SDMQualityTesting(data_model_repo_url=data,
-                                            mail=email,
-                                            last_test_number=tests,
-                                            logger=request.app.logger)
+    return params, None
 
-    resp = sdm_quality_testing.do_tests()
-    response.status_code = status.HTTP_200_OK
 
-    return resp
+def run_quality_tests(data_model_repo_url: str, mail: str, last_test_number: int, logger) -> dict:
+    sdm_quality_testing = SDMQualityTesting(data_model_repo_url=data_model_repo_url,
+                                            mail=mail,
+                                            last_test_number=last_test_number,
+                                            logger=logger)
+
+    return sdm_quality_testing.do_tests()
 
 
 def get_uptime():
@@ -27,10 +27,10 @@ from smartdatamodels.utils import SDMUtils
 
 
 class MDExist:
-    def __init__(self, logger, generate_output_file):
+    def __init__(self, logger, generate_output_file, fetch_cache=None):
         self.logger = logger
 
-        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file)
+        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache)
 
         self.metadata_check = {
             "id": lambda output, json_dict, repo_url: self.check_id(output, json_dict),
@@ -28,9 +28,9 @@ from smartdatamodels.utils import SDMUtils
 
 
 class MDReported:
-    def __init__(self, logger, generate_output_file):
+    def __init__(self, logger, generate_output_file, fetch_cache=None):
         self.logger = logger
-        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file)
+        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache)
 
     def is_metadata_properly_reported(self, output, schema_dict):
         try:
@@ -24,28 +24,58 @@
 
 # TODO: import the function from python package by "from pysmartdatamodel.utils import *"
 
-from os.path import exists, getmtime, join
-from gzip import open, GzipFile, decompress
+from os import getpid, replace, stat
+from os.path import exists, join
 from datetime import datetime, timedelta
-from threading import Thread, Condition, Event
-from time import sleep, time
-from requests import get
-from common.config import CODE_HOME
-from json import loads
+from json import load, dump
+from random import uniform
+from threading import Thread, Condition, Event, Lock
+from time import time
+from common.config import CODE_HOME, CONFIG_DATA
+from smartdatamodels.SDMHttpClient import http_client
+from smartdatamodels.SDMPropertyIndex import SDMPropertyIndex, SDMPropertyDBIndex, iter_database
 
 
 class SDMProperties:
     def __init__(self, logger):
-        self.properties = list()
+        # SDMPropertyIndex of the database, None until the database is read
+        self.index = None
         self.logger = logger
 
         self.file_url = "https://smartdatamodels.org/extra/smartdatamodels.gz"
         self.gz_save_path = join(CODE_HOME, "mastercheck_output", "smartdatamodels.gz")
         self.json_save_path = join(CODE_HOME, "mastercheck_output", "smartdatamodels.json")
 
-        self.check_interval_minutes = 1
-
-        # Create a Condition object
+        # "memory" keeps the index in the process, "sqlite" converts the database into a SQLite
+        # file which is queried lazily and shared by all the processes
+        properties_config = CONFIG_DATA.get("properties", dict())
+        self.backend = properties_config.get("backend", "memory")
+        self.db_save_path = properties_config.get("sqlite_path") or \
+            join(CODE_HOME, "mastercheck_output", "smartdatamodels.sqlite")
+
+        # the database is revalidated with a conditional request every refresh_interval_minutes, plus
+        # a random delay of up to refresh_jitter_seconds so that the processes do not refresh together
+        self.refresh_interval_minutes = properties_config.get("refresh_interval_minutes", 60)
+        self.refresh_jitter_seconds = properties_config.get("refresh_jitter_seconds", 60)
+
+        # ETag and Last-Modified of the downloaded file, and time of the last revalidation
+        self.validators_save_path = f"{self.gz_save_path}.json"
+
+        # refresh activity, reported by stats()
+        self.downloads = 0
+        self.last_download = None
+        self.not_modified = 0
+        self.reads = 0
+        self.last_read = None
+        self.last_refresh = None
+        self.last_refresh_status = None
+        self.next_refresh = None
+        self.index_memory = 0
+
+        # size and modification time of the database file read, they identify its version
+        self.version = None
+
+        # Condition used to wait for the first load of the database
         self.data_available = Condition()
 
         # Create a stop event
@@ -57,36 +87,101 @@ class SDMProperties:
 
     def check_file_background(self, event: Event):
         while not event.is_set():
-            if exists(self.gz_save_path):
-                modified_time = datetime.fromtimestamp(getmtime(self.gz_save_path))
-                current_time = datetime.now()
-                if (current_time - modified_time) < timedelta(hours=1):
-                    self.logger.debug("File already exists and is less than 1 hour old. Skipping download.")
-                    if not self.properties:
-                        self.read_file()
-                    else:
-                        with self.data_available:
-                            self.data_available.notify()
-                else:
-                    self.logger.debug("File exists but is older than 1 hour. Downloading...")
-                    self.download_file()
+            self.refresh()
+
+            # Sleep until the next refresh, or until the thread is stopped. The database is requested
+            # again after one minute while it could not be loaded.
+            if self.index is None:
+                interval = 60
+            else:
+                interval = self.refresh_interval_minutes * 60 + uniform(0, self.refresh_jitter_seconds)
+            self.next_refresh = datetime.now() + timedelta(seconds=interval)
+            event.wait(interval)
+
+    def refresh(self):
+        """
+        Revalidate the database file and load it if it changed or it is not loaded yet. A failed refresh
+        keeps the current database.
+        """
+        try:
+            validators = self.read_validators()
+
+            # the file on disk is used at once, before it is revalidated
+            if self.index is None and exists(self.gz_save_path):
+                try:
+                    self.read_file()
+                except Exception as e:
+                    # the file is not usable, it is downloaded again without validators
+                    self.logger.error(f"Unable to read the properties database file: {e}")
+                    validators = dict()
+
+            last_check = validators.get("checked", 0)
+
+            if self.index is None or time() - last_check >= self.refresh_interval_minutes * 60:
+                if self.download_file(validators):
                     self.read_file()
+                    self.last_refresh_status = "updated"
+                else:
+                    self.last_refresh_status = "not modified"
             else:
-                self.logger.debug("File does not exist. Downloading...")
-                self.download_file()
-                self.read_file()
+                self.logger.debug("Database file revalidated less than refresh_interval_minutes ago")
+                self.last_refresh_status = "fresh"
+        except Exception as e:
+            self.logger.error(f"Unable to refresh the properties database: {e}")
+            self.last_refresh_status = f"error: {e}"
+
+        self.last_refresh = datetime.now()
+
+    def read_validators(self) -> dict:
+        if not exists(self.gz_save_path) or not exists(self.validators_save_path):
+            return dict()
+
+        try:
+            with open(self.validators_save_path, "r") as file:
+                return load(file)
+        except ValueError:
+            return dict()
+
+    def write_validators(self, validators: dict):
+        temporary_path = f"{self.validators_save_path}.{getpid()}.tmp"
+
+        with open(temporary_path, "w") as file:
+            dump(validators, file)
+
+        replace(temporary_path, self.validators_save_path)
+
+    def download_file(self, validators: dict = None) -> bool:
+        """
+        Download the database file if it changed since the last download, return whether it was downloaded
+        """
+        validators = dict() if validators is None else validators
+
+        headers = dict()
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        response = http_client.get(self.file_url, stream=True, headers=headers)
 
-            # Sleep for the specified interval
-            sleep(self.check_interval_minutes * 60)
+        if response.status_code == 304:
+            response.close()
+            self.not_modified += 1
+            self.write_validators(dict(validators, checked=time()))
+            self.logger.debug("Database file not modified")
+            return False
+
+        response.raise_for_status()
 
-    def download_file(self):
-        response = get(self.file_url, stream=True)
         total_size = int(response.headers.get('content-length', 0))
-        block_size = 1024  # Adjust the block size as per your needs
+        block_size = 65536
 
         start_time = time()  # Start time
 
-        with open(self.gz_save_path, 'wb') as file:
+        # the file is replaced once it is complete, so it is never read half written
+        temporary_path = f"{self.gz_save_path}.{getpid()}.tmp"
+
+        with open(temporary_path, 'wb') as file:
             for data in response.iter_content(block_size):
                 file.write(data)
                 downloaded_size = file.tell()
@@ -94,91 +189,106 @@ class SDMProperties:
                 # print(progress, end='\r', flush=True)
                 self.logger.debug(progress)
 
+        replace(temporary_path, self.gz_save_path)
+
+        validators = {"checked": time()}
+        if response.headers.get("ETag"):
+            validators["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["last_modified"] = response.headers["Last-Modified"]
+        self.write_validators(validators)
+
         end_time = time()  # End time
 
+        self.downloads += 1
+        self.last_download = datetime.now()
+
         self.logger.info("Download complete!")
         elapsed_time = end_time - start_time
         self.logger.info(f"Total time: {elapsed_time:.2f} seconds")
 
+        return True
+
     def read_file(self):
+        """
+        Build the index of the database file and replace the current one. The index is built without
+        holding any lock, the checks running meanwhile keep using the previous index.
+        """
+        file_stat = stat(self.gz_save_path)
+        version = f"{file_stat.st_size}-{file_stat.st_mtime_ns}"
+
+        if self.backend == "sqlite":
+            # the SQLite file is built only once per version of the database file
+            if not SDMPropertyDBIndex.is_up_to_date(self.db_save_path, self.gz_save_path):
+                SDMPropertyDBIndex.build(self.db_save_path, self.gz_save_path)
+                self.logger.info(f"SQLite index of the database built in {self.db_save_path}")
+
+            index = SDMPropertyDBIndex(self.db_save_path)
+        else:
+            # the database file is parsed incrementally, only the property, dataModel, description
+            # and type keys are kept in the index
+            index = SDMPropertyIndex(iter_database(self.gz_save_path))
+
+        index_memory = index.memory_usage()
+
         with self.data_available:
-            f = GzipFile(self.gz_save_path, "rb", )
-            properties = f.read()
-            decompressed_data = decompress(properties)
-            json_data = loads(decompressed_data)
+            self.index = index
+            self.index_memory = index_memory
+            self.version = version
 
-            keys_to_keep = ['property', 'dataModel', 'description', 'type']
-            self.properties = [
-                {key: d[key] for key in keys_to_keep if key in d}
-                for d in json_data
-            ]
+            self.reads += 1
+            self.last_read = datetime.now()
 
-            self.data_available.notify()
+            self.data_available.notify_all()
 
-        self.logger.info("Database file read")
+        self.logger.info(f"Database file read, {len(index)} entries, {index_memory} bytes")
 
     def is_property_already_existed(self, output, yaml_dict):
         common_properties = ["id", "name", "description", "location", "seeAlso", "dateCreated", "dateModified",
                              "source", "alternateName", "dataProvider", "owner", "address", "areaServed", "type"]
 
-        data_models_list = list()
-        descriptions = list()
-        types = list()
         output["alreadyUsedProperties"] = list()
         output["availableProperties"] = list()
 
-        def get_value(data_property, property_key, error_message):
-            try:
-                return data_property[property_key]
-            except KeyError:
-                return error_message
-
         try:
             # Acquire the lock associated with the Condition
             with self.data_available:
                 # Wait until data is available
-                while len(self.properties) == 0:
+                while self.index is None:
                     self.data_available.wait()
 
+            index = self.index
+
             keys_yaml_data = list(yaml_dict.keys())
             keys_to_search = [key for key in keys_yaml_data if key not in common_properties]
-            data_properties = [x for x in self.properties if x['property'] in keys_to_search]
 
             # TODO: Need to check if the attribute is not defined in the smart data models database
-            for index, item in enumerate(keys_to_search):
-                aux = [x for x in data_properties if x['property'] == item]
+            for position, item in enumerate(keys_to_search):
+                property_entries = index.lookup(item)
 
-                if not aux:
+                if property_entries is None:
                     output["availableProperties"].append({item: "Available"})
                     continue
 
-                data_models_list.append([f"{index + 1}.- {x['dataModel']}" for x in aux])
+                number = f"{position + 1}.-"
 
-                descriptions.append(
-                    [f"{index + 1}.-{get_value(x, 'description', 'missing description')}"
-                     for x in aux])
+                data_models_list = [f"{number} {x}" for x in property_entries.data_models]
 
                 # The descriptions may be different but we assume this issue for the moment
-                # descriptions = [list(set(x)) for x in descriptions]
-                # properties_problem_description = [x for x in descriptions if len(x) > 1]
-                #
-                types.append(
-                    [f"{index + 1}.-{get_value(x, 'type', 'missing type')}"
-                     for x in aux])
+                descriptions = [f"{number}{x}" for x in property_entries.descriptions]
 
                 # The types MUST be the same, so we check that all the properties defined in SDM
                 # have the same type
-                types = [list(set(x)) for x in types]
-                properties_problem_type = [x for x in types if len(x) > 1]
+                types = [f"{number}{x}" for x in property_entries.distinct_types]
 
-                if len(properties_problem_type) > 0:
+                if len(types) > 1:
                     output["alreadyUsedProperties"].append(
                         {"Error": f"Same property '{item}' with different types provided: "
-                                  f"{properties_problem_type}."})
+                                  f"{[types]}."})
 
-                message = (f"Already used in data models: '{', '.join(data_models_list[0])}' "
-                           f"with these definitions: '{chr(13).join(descriptions[0])}' "
-                           f"and these data types: '{', '.join(types[0])}'")
+                message = (f"Already used in data models: '{', '.join(data_models_list)}' "
+                           f"with these definitions: '{chr(13).join(descriptions)}' "
+                           f"and these data types: '{', '.join(types)}'")
 
                 output["alreadyUsedProperties"].append({item: message})
 
@@ -188,6 +298,31 @@ class SDMProperties:
 
         return output
 
+    def is_alive(self) -> bool:
+        return self.background_thread.is_alive()
+
+    def stats(self) -> dict:
+        index = self.index
+
+        return {
+            "loaded": index is not None,
+            "entries": len(index) if index is not None else 0,
+            "properties": index.property_count() if index is not None else 0,
+            "backend": self.backend,
+            "memory_bytes": self.index_memory,
+            "downloads": self.downloads,
+            "last_download": str(self.last_download) if self.last_download else None,
+            "not_modified": self.not_modified,
+            "reads": self.reads,
+            "last_read": str(self.last_read) if self.last_read else None,
+            "refresh_interval_minutes": self.refresh_interval_minutes,
+            "refresh_jitter_seconds": self.refresh_jitter_seconds,
+            "last_refresh": str(self.last_refresh) if self.last_refresh else None,
+            "last_refresh_status": self.last_refresh_status,
+            "next_refresh": str(self.next_refresh) if self.next_refresh else None,
+            "thread_alive": self.is_alive()
+        }
+
     def stop(self):
         """
         Send the message to stop the thread
@@ -198,6 +333,40 @@ class SDMProperties:
 
         # Wait for the thread to finish
         self.background_thread.join()
-        self.background_thread.join()
 
         self.logger.debug("SDMProperties::Thread has been stopped.")
+
+
+################################################
+# Process-wide properties database
+#
+# All the runs of the process share the same SDMProperties (and so the same background
+# thread and the same copy of the database), it is created by the first run that needs it
+################################################
+sdm_properties = None
+sdm_properties_lock = Lock()
+
+
+def get_sdm_properties(logger) -> SDMProperties:
+    """
+    Get the shared SDMProperties, starting it if it does not exist or it was stopped
+    """
+    global sdm_properties
+
+    with sdm_properties_lock:
+        if sdm_properties is None or not sdm_properties.is_alive():
+            sdm_properties = SDMProperties(logger=logger)
+
+        return sdm_properties
+
+
+def stop_sdm_properties():
+    """
+    Stop the background thread of the shared SDMProperties, if it was started
+    """
+    global sdm_properties
+
+    with sdm_properties_lock:
+        if sdm_properties is not None:
+            sdm_properties.stop()
+            sdm_properties = None
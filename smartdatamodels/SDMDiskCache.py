@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Persistent HTTP response cache. The bodies are stored on disk together with their
+# validators (ETag, Last-Modified) so that the next runs revalidate them with a
+# conditional GET and only download again the files that really changed. The index of
+# the bodies is a SQLite database, so that all the processes of the host (server
+# workers, command line) share the cache and its size limit.
+
+from os import makedirs, replace, remove, listdir, getpid, stat
+from os.path import join
+from hashlib import sha256
+from tempfile import mkstemp
+from threading import local, Lock, get_ident
+from time import time
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+import sqlite3
+
+INDEX_NAME = "index.sqlite"
+
+# temporary body files older than this are left by a process which stopped while writing them
+STALE_TMP_SECONDS = 3600
+
+
+class SDMDiskCache:
+    def __init__(self, directory: str, max_size_mb: float = 100):
+        self.directory = directory
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.index_path = join(self.directory, INDEX_NAME)
+
+        # sqlite3 connections cannot be shared between threads, each thread opens its own one
+        self.connections = local()
+        self.initialized = False
+
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.connections, "connection", None)
+        if connection is None:
+            # the directory is created by the first request, not when the module is imported
+            makedirs(self.directory, exist_ok=True)
+
+            # autocommit mode, the transactions are opened explicitly
+            connection = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self.connections.connection = connection
+
+            with self.lock:
+                if not self.initialized:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute("""
+                        CREATE TABLE IF NOT EXISTS entries (
+                            url TEXT PRIMARY KEY,
+                            file TEXT NOT NULL,
+                            etag TEXT,
+                            last_modified TEXT,
+                            content_type TEXT,
+                            size INTEGER NOT NULL,
+                            last_access REAL NOT NULL
+                        )""")
+                    connection.execute("CREATE INDEX IF NOT EXISTS entries_access ON entries (last_access)")
+                    self.sweep(connection)
+                    self.initialized = True
+
+        return connection
+
+    def sweep(self, connection: sqlite3.Connection):
+        """
+        Remove the body files which are not in the index: bodies of the entries evicted by a process which
+        stopped before removing them, temporary files left by an interrupted write, index.json of older versions
+        """
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            files = {row["file"] for row in connection.execute("SELECT file FROM entries")}
+            now = time()
+
+            for name in listdir(self.directory):
+                if name.startswith(INDEX_NAME) or name in files:
+                    continue
+
+                path = join(self.directory, name)
+                try:
+                    # a temporary file may be written by another process at this moment
+                    if name.endswith(".tmp") and now - stat(path).st_mtime < STALE_TMP_SECONDS:
+                        continue
+
+                    remove(path)
+                except (FileNotFoundError, IsADirectoryError, PermissionError):
+                    pass
+
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    @property
+    def size(self) -> int:
+        return self.connection().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def validators(self, url: str) -> dict:
+        """
+        Get the conditional request headers of the cached url, an empty dict if it is not cached
+        """
+        headers = dict()
+
+        entry = self.connection().execute("SELECT etag, last_modified FROM entries WHERE url = ?",
+                                          (url,)).fetchone()
+
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def load(self, url: str, not_modified: Response = None) -> [Response, None]:
+        """
+        Build the response of the url from the body stored on disk, after a 304 Not Modified answer
+        """
+        connection = self.connection()
+
+        entry = connection.execute("SELECT * FROM entries WHERE url = ?", (url,)).fetchone()
+        if entry is None:
+            return None
+
+        try:
+            with open(join(self.directory, entry["file"]), "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            connection.execute("DELETE FROM entries WHERE url = ? AND file = ?", (url, entry["file"]))
+            return None
+
+        connection.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time(), url))
+
+        with self.lock:
+            self.hits += 1
+
+        response = Response()
+        response.status_code = 200
+        response.url = url
+        response._content = content
+        response.headers = CaseInsensitiveDict(not_modified.headers if not_modified is not None else {})
+        if entry["content_type"]:
+            response.headers["Content-Type"] = entry["content_type"]
+        response.headers["Content-Length"] = str(len(content))
+        response.encoding = not_modified.encoding if not_modified is not None else None
+        response.from_cache = True
+
+        return response
+
+    def store(self, url: str, response: Response) -> bool:
+        """
+        Store the body of a 200 response with its validators, evicting the least recently used
+        entries over the size limit. Responses without validators cannot be revalidated and are not stored.
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        content = response.content
+
+        with self.lock:
+            self.misses += 1
+
+        if (etag is None and last_modified is None) or len(content) > self.max_size:
+            return False
+
+        connection = self.connection()
+        file_name = sha256(url.encode("utf-8")).hexdigest()
+
+        # the body is written in a file unique to the process and the thread, and renamed once complete
+        descriptor, tmp_path = mkstemp(dir=self.directory, prefix=f"{file_name}.{getpid()}.{get_ident()}.",
+                                       suffix=".tmp")
+        try:
+            with open(descriptor, "wb") as file:
+                file.write(content)
+
+            # the rename and the index are updated together, a concurrent sweep or eviction sees both or none
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                replace(tmp_path, join(self.directory, file_name))
+
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (url, file, etag, last_modified, content_type, size, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, file_name, etag, last_modified, response.headers.get("Content-Type"), len(content), time()))
+
+                self.evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            try:
+                remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+        return True
+
+    def evict(self, connection: sqlite3.Connection):
+        """
+        Remove the least recently used entries until the cache fits in its maximum size, in the transaction
+        of the caller
+        """
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        for entry in connection.execute("SELECT url, file, size FROM entries ORDER BY last_access").fetchall():
+            try:
+                remove(join(self.directory, entry["file"]))
+            except FileNotFoundError:
+                pass
+
+            connection.execute("DELETE FROM entries WHERE url = ?", (entry["url"],))
+            total_size -= entry["size"]
+
+            with self.lock:
+                self.evictions += 1
+
+            if total_size <= self.max_size:
+                break
+
+    def stats(self) -> dict:
+        count, size = self.connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+        with self.lock:
+            return {
+                "entries": count,
+                "size": size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def clear(self):
+        connection = self.connection()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for entry in connection.execute("SELECT file FROM entries").fetchall():
+                try:
+                    remove(join(self.directory, entry["file"]))
+                except FileNotFoundError:
+                    pass
+
+            connection.execute("DELETE FROM entries")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# In-process bus of the progress events of the quality tests ("loading", "processing",
+# "passed", "failed"...). Each run publishes to its own channel, the subscribers of the
+# channel receive the events as they are published and a late subscriber receives first
+# the events already published, so that nothing is lost.
+
+from collections import deque
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+from common.config import CONFIG_DATA
+
+
+class SDMEventChannel:
+    """
+    Channel of one run, passed to the checks to publish their progress
+    """
+    def __init__(self, bus, name: str):
+        self.bus = bus
+        self.name = name
+
+    def publish(self, event_type: str, data: dict = None):
+        self.bus.publish(self.name, event_type, data)
+
+    def close(self, data: dict = None):
+        """
+        Publish the last event of the channel, of type "end"
+        """
+        self.bus.close(self.name, data)
+
+
+class SDMEventBus:
+    def __init__(self, history_size: int = 1000, ttl_seconds: float = 3600):
+        self.history_size = history_size
+        self.ttl_seconds = ttl_seconds
+
+        # channel name -> {"events": last events, "subscribers": callbacks, "closed": monotonic time or None}
+        self.channels = dict()
+        self.lock = Lock()
+
+        self.published = 0
+
+    def channel(self, name: str) -> SDMEventChannel:
+        self.purge()
+
+        with self.lock:
+            self.channels.setdefault(name, {"events": deque(maxlen=self.history_size),
+                                            "subscribers": list(),
+                                            "closed": None,
+                                            "sequence": 0})
+
+        return SDMEventChannel(bus=self, name=name)
+
+    def publish(self, name: str, event_type: str, data: dict = None):
+        with self.lock:
+            channel = self.channels.get(name)
+            if channel is None or channel["closed"] is not None:
+                return
+
+            channel["sequence"] += 1
+            event = dict(data or dict(), id=channel["sequence"], type=event_type, time=datetime.now().isoformat())
+
+            channel["events"].append(event)
+            subscribers = list(channel["subscribers"])
+            self.published += 1
+
+            if event_type == "end":
+                channel["closed"] = monotonic()
+
+        # the callbacks must not block, they are called by the thread running the tests
+        for callback in subscribers:
+            callback(event)
+
+    def close(self, name: str, data: dict = None):
+        self.publish(name, "end", data)
+
+    def subscribe(self, name: str, callback) -> [list, None]:
+        """
+        Call callback(event) for each event published in the channel. Return the events already published,
+        or None if the channel does not exist.
+        """
+        with self.lock:
+            channel = self.channels.get(name)
+            if channel is None:
+                return None
+
+            if channel["closed"] is None:
+                channel["subscribers"].append(callback)
+
+            return list(channel["events"])
+
+    def unsubscribe(self, name: str, callback):
+        with self.lock:
+            channel = self.channels.get(name)
+            if channel is not None and callback in channel["subscribers"]:
+                channel["subscribers"].remove(callback)
+
+    def open_channels(self) -> list:
+        """
+        Names of the channels whose "end" event has not been published yet
+        """
+        with self.lock:
+            return [name for name, channel in self.channels.items() if channel["closed"] is None]
+
+    def purge(self):
+        """
+        Forget the channels closed more than ttl_seconds ago
+        """
+        now = monotonic()
+
+        with self.lock:
+            expired = [name for name, channel in self.channels.items()
+                       if channel["closed"] is not None and now - channel["closed"] > self.ttl_seconds]
+
+            for name in expired:
+                self.channels.pop(name)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "channels": len(self.channels),
+                "open": sum(1 for channel in self.channels.values() if channel["closed"] is None),
+                "subscribers": sum(len(channel["subscribers"]) for channel in self.channels.values()),
+                "published": self.published
+            }
+
+
+event_bus_config = CONFIG_DATA.get("events", dict())
+
+event_bus = SDMEventBus(history_size=event_bus_config.get("history_size", 1000),
+                        ttl_seconds=event_bus_config.get("ttl_seconds", 3600))
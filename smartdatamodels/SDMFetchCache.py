@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Run-scoped memoization of the remote files, shared by all the checks of one
+# SDMQualityTesting run, so that schema.json, the examples and the other files
+# are downloaded only once per run whatever the number of checks reading them.
+
+from collections import Counter
+from hashlib import sha256
+from threading import Lock
+from smartdatamodels.SDMHttpClient import http_client
+
+
+class SDMFetchCache:
+    def __init__(self, client=None):
+        self.client = http_client if client is None else client
+
+        self.responses = dict()
+        self.url_locks = dict()
+        self.lock = Lock()
+
+        # number of network requests per (method, url), and number of requests served from memory
+        self.fetch_counts = Counter()
+        self.hits = 0
+
+        # (method, url) of the requests made by the test in progress -> digest of the response served by another
+        # store (None if it is read from this cache), None if they are not recorded
+        self.recorded = None
+
+    def get(self, url: str):
+        """
+        Get the response of the url, downloading it only the first time that it is requested in the run.
+        A failed download is memoized as well and the same exception is raised to the following callers.
+        """
+        return self.fetch(method="GET", url=url)
+
+    def head(self, url: str):
+        """
+        Get the headers of the url, reusing the GET response if the url was already downloaded in the run
+        """
+        if ("GET", url) in self.responses:
+            return self.get(url)
+
+        return self.fetch(method="HEAD", url=url)
+
+    def fetch(self, method: str, url: str):
+        key = (method, url)
+
+        self.depend(url=url, method=method)
+
+        with self.lock:
+            url_lock = self.url_locks.setdefault(key, Lock())
+
+        # one lock per request, concurrent requests of the same url wait for the first download
+        with url_lock:
+            if key in self.responses:
+                with self.lock:
+                    self.hits += 1
+            else:
+                try:
+                    if method == "HEAD":
+                        self.responses[key] = self.client.head(url)
+                    else:
+                        self.responses[key] = self.client.get(url)
+                except Exception as e:
+                    self.responses[key] = e
+
+                with self.lock:
+                    self.fetch_counts[key] += 1
+
+        response = self.responses[key]
+        if isinstance(response, Exception):
+            raise response
+
+        return response
+
+    def start_recording(self):
+        """
+        Record the urls requested from now on, the files on which the test in progress depends
+        """
+        with self.lock:
+            self.recorded = dict()
+
+    def stop_recording(self) -> dict:
+        """
+        Stop recording and return the {(method, url): digest} recorded
+        """
+        with self.lock:
+            recorded, self.recorded = self.recorded, None
+
+        return recorded if recorded is not None else dict()
+
+    def depend(self, url: str, method: str = "GET", digest: str = None):
+        """
+        Record a url read by the test in progress without requesting it, e.g. a $ref served by the ref store,
+        with the digest of the response served if it may not be the one of this cache
+        """
+        with self.lock:
+            if self.recorded is not None:
+                if digest is not None:
+                    self.recorded[(method, url)] = digest
+                else:
+                    self.recorded.setdefault((method, url), None)
+
+    def digest(self, url: str, method: str = "GET") -> [str, None]:
+        """
+        Hash of the response of the url, its status code only for a HEAD request. None if the request failed
+        or the server answered with an error, the response may not be the same the next time.
+        """
+        try:
+            response = self.fetch(method=method, url=url)
+        except Exception:
+            return None
+
+        return response_digest(response, method=method)
+
+    def fetch_count(self, url: str = None, method: str = "GET") -> int:
+        """
+        Number of network requests of the url, or of all the urls if no url is provided
+        """
+        if url is None:
+            return sum(count for (key_method, _), count in self.fetch_counts.items() if key_method == method)
+
+        return self.fetch_counts[(method, url)]
+
+    def stats(self) -> dict:
+        return {
+            "urls": len(self.responses),
+            "fetches": self.fetch_count(),
+            "probes": self.fetch_count(method="HEAD"),
+            "hits": self.hits
+        }
+
+    def clear(self):
+        with self.lock:
+            self.responses.clear()
+            self.url_locks.clear()
+            self.fetch_counts.clear()
+            self.hits = 0
+            self.recorded = None
+
+
+def response_digest(response, method: str = "GET") -> [str, None]:
+    """
+    Hash of a response, its status code only for a HEAD request. None if the server answered with an error
+    """
+    if response.status_code >= 500:
+        return None
+
+    if method == "HEAD":
+        return str(response.status_code)
+
+    return sha256(str(response.status_code).encode() + b"\n" + response.content).hexdigest()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Process-wide HTTP client shared by all the checks, so that the requests to
+# raw.githubusercontent.com, github.com and smartdatamodels.org reuse the
+# already opened TCP+TLS connections instead of creating a new one per request.
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from threading import Lock
+from os.path import join
+from common.config import CONFIG_DATA, CODE_HOME
+from smartdatamodels.SDMDiskCache import SDMDiskCache
+
+
+class SDMHttpClient:
+    def __init__(self, http_config: dict = None, disk_cache: SDMDiskCache = None):
+        if http_config is None:
+            http_config = dict()
+
+        self.pool_connections = http_config.get("pool_connections", 4)
+        self.pool_maxsize = http_config.get("pool_maxsize", 16)
+        self.connect_timeout = http_config.get("connect_timeout", 3.05)
+        self.read_timeout = http_config.get("read_timeout", 10)
+        self.max_retries = http_config.get("max_retries", 2)
+
+        # pool_connections is the number of hosts whose pools are kept alive,
+        # pool_maxsize the number of keep-alive connections kept per host. When the retries
+        # run out, the last 5xx response is returned to the caller instead of a RetryError
+        retries = Retry(total=self.max_retries,
+                        backoff_factor=0.2,
+                        status_forcelist=[502, 503, 504],
+                        allowed_methods=["HEAD", "GET"],
+                        raise_on_status=False)
+
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              max_retries=retries)
+
+        self.session = Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # persistent cache of the GET responses, revalidated with conditional requests
+        self.disk_cache = disk_cache
+
+        self.lock = Lock()
+        self.requests_sent = 0
+
+    @property
+    def timeout(self) -> tuple:
+        return self.connect_timeout, self.read_timeout
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Send a request through the shared session, applying the configured connect/read timeouts
+        unless the caller provides its own timeout
+        """
+        kwargs.setdefault("timeout", self.timeout)
+
+        with self.lock:
+            self.requests_sent += 1
+
+        return self.session.request(method=method, url=url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        """
+        GET the url. When the disk cache is enabled, a cached url is revalidated with a conditional request
+        and, if it has not changed (304 Not Modified), its body is read from disk instead of downloaded again
+        """
+        if self.disk_cache is None or kwargs.get("stream", False):
+            return self.request("GET", url, **kwargs)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        conditional_headers = dict(headers, **self.disk_cache.validators(url))
+
+        response = self.request("GET", url, headers=conditional_headers, **kwargs)
+
+        if response.status_code == 304:
+            cached_response = self.disk_cache.load(url, response)
+
+            if cached_response is not None:
+                return cached_response
+
+            # the body is not on disk anymore, download it without validators
+            response = self.request("GET", url, headers=headers, **kwargs)
+
+        if response.status_code == 200:
+            self.disk_cache.store(url, response)
+
+        return response
+
+    def head(self, url: str, **kwargs):
+        kwargs.setdefault("allow_redirects", True)
+        return self.request("HEAD", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests_sent,
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "timeout": list(self.timeout),
+            "disk_cache": self.disk_cache.stats() if self.disk_cache is not None else None
+        }
+
+    def close(self):
+        self.session.close()
+
+
+def create_disk_cache(cache_config: dict = None) -> [SDMDiskCache, None]:
+    if cache_config is None or not cache_config.get("enabled", False):
+        return None
+
+    directory = cache_config.get("directory") or join(CODE_HOME, "mastercheck_output", "http_cache")
+
+    return SDMDiskCache(directory=directory, max_size_mb=cache_config.get("max_size_mb", 100))
+
+
+http_client = SDMHttpClient(http_config=CONFIG_DATA.get("http"),
+                            disk_cache=create_disk_cache(CONFIG_DATA.get("http_cache")))
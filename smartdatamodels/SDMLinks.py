@@ -20,13 +20,17 @@
 # under the License.
 ##
 
-from requests import get
 from requests.exceptions import HTTPError, RequestException, ReadTimeout, ConnectionError
 from json.decoder import JSONDecodeError
-from os.path import join
+from json import load, dump
+from os import getpid, replace
+from os.path import join, exists
 from threading import Thread, Condition, Event
-from time import sleep
 from datetime import datetime, timedelta
+from bisect import bisect_left
+from operator import itemgetter
+from common.config import CODE_HOME
+from smartdatamodels.SDMHttpClient import http_client
 import logging
 
 
@@ -34,10 +38,8 @@ class SDMLinks:
     def __init__(self, logger=None):
         self.official_list_data_models = ('https://raw.githubusercontent.com/smart-data-models/data-models/master/'
                                           'specs/AllSubjects/official_list_data_models.json')
-        self.official_list_data_models_data = dict()
 
         self.data_models_metadata = 'https://smartdatamodels.org/extra/datamodels_metadata.json'
-        self.data_models_metadata_data = dict()
 
         if logger is None:
             logging.basicConfig(filename='app.log',
@@ -48,12 +50,28 @@ class SDMLinks:
         else:
             self.logger = logger
 
+        # entity name -> links of its repository and of its model.yaml, built when the files are downloaded
+        self.links = None
+
+        # (lowercase name, name, links) of the entities sorted by lowercase name, for the prefix searches
+        self.sorted_entities = list()
+
         self.check_interval_minutes = 1
         self.obtained_time = datetime.now()
 
+        # last links obtained, so that a restarted process can serve them at once while they are revalidated
+        self.snapshot_path = join(CODE_HOME, "mastercheck_output", "sdm_links.json")
+
+        # "snapshot" or "remote", and whether the links were downloaded by this process
+        self.source = None
+        self.revalidated = False
+        self.failed_downloads = 0
+
         # Create a Condition object
         self.data_available = Condition()
 
+        self.load_snapshot()
+
         # Create a stop event
         self.__kill = Event()
 
@@ -64,84 +82,230 @@ class SDMLinks:
     def get_files_background(self, event: Event = None):
         while not event.is_set():
             current_time = datetime.now()
+            wait_seconds = self.check_interval_minutes * 60
+
+            if not self.revalidated or (current_time - self.obtained_time) > timedelta(days=7):
+                official_list_data_models_data = self.__get_data__(url=self.official_list_data_models)
+                data_models_metadata_data = self.__get_data__(url=self.data_models_metadata)
+
+                if official_list_data_models_data is not None and data_models_metadata_data is not None:
+                    links = self.build_links(official_list=official_list_data_models_data,
+                                             metadata=data_models_metadata_data)
+
+                    if links != self.links:
+                        self.save_snapshot(links)
+
+                    sorted_entities = self.sort_entities(links)
+
+                    with self.data_available:
+                        self.links = links
+                        self.sorted_entities = sorted_entities
+                        self.obtained_time = datetime.now()
+                        self.source = "remote"
+                        self.revalidated = True
+                        self.failed_downloads = 0
+
+                        self.data_available.notify_all()
 
-            if len(self.data_models_metadata_data) == 0 or (current_time - self.obtained_time) > timedelta(days=7):
-                self.official_list_data_models_data = self.__get_data__(url=self.official_list_data_models)
-                self.data_models_metadata_data = self.__get_data__(url=self.data_models_metadata)
+                    self.logger.info(f"Download complete! {len(links)} entities indexed")
+                    elapsed_time = self.obtained_time - current_time
+                    self.logger.info(f"Total time: {elapsed_time.total_seconds():.2f} seconds")
+                else:
+                    self.failed_downloads += 1
+                    self.logger.error("Unable to download the list of data models, keeping the previous one")
 
-                self.obtained_time = datetime.now()
+                    # retry sooner, with an exponential backoff, until the first download succeeds
+                    if not self.revalidated:
+                        wait_seconds = min(wait_seconds, 2 ** self.failed_downloads)
 
-                self.logger.info("Download complete!")
-                elapsed_time = self.obtained_time - current_time
-                self.logger.info(f"Total time: {elapsed_time.total_seconds():.2f} seconds")
+            # Sleep for the specified interval, or until the thread is stopped
+            event.wait(wait_seconds)
 
-            with self.data_available:
-                self.data_available.notify()
+    def load_snapshot(self):
+        """
+        Load the links saved by the last download, if any, so that they are served while they are revalidated
+        """
+        if not exists(self.snapshot_path):
+            return
+
+        try:
+            with open(self.snapshot_path, "r") as file:
+                snapshot = load(file)
+
+            links = snapshot["links"]
+            obtained_time = datetime.fromisoformat(snapshot["obtained_time"])
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.error(f"Unable to read the snapshot of the list of data models: {e}")
+            return
 
-            # Sleep for the specified interval, in seconds
-            sleep(self.check_interval_minutes * 60)
+        sorted_entities = self.sort_entities(links)
+
+        with self.data_available:
+            self.links = links
+            self.sorted_entities = sorted_entities
+            self.obtained_time = obtained_time
+            self.source = "snapshot"
+
+            self.data_available.notify_all()
+
+        self.logger.info(f"Snapshot of the list of data models loaded, {len(links)} entities")
+
+    def save_snapshot(self, links: dict):
+        # the snapshot is replaced once it is complete, so it is never read half written
+        temporary_path = f"{self.snapshot_path}.{getpid()}.tmp"
+
+        try:
+            with open(temporary_path, "w") as file:
+                dump({"obtained_time": datetime.now().isoformat(), "links": links}, file)
+
+            replace(temporary_path, self.snapshot_path)
+        except OSError as e:
+            self.logger.error(f"Unable to save the snapshot of the list of data models: {e}")
+
+    @staticmethod
+    def build_links(official_list: dict, metadata: list) -> dict:
+        """
+        Index the official list of data models and their metadata by entity name, with the links of
+        each entity already resolved. Only the entities present in both documents are indexed.
+        """
+        # entity name -> entry of its subject in the official list (the first one, as the linear search did)
+        official_data_models = dict()
+        for subject in official_list.get('officialList', list()):
+            for entity_name in subject.get('dataModels', list()):
+                official_data_models.setdefault(entity_name, subject)
+
+        yaml_links = dict()
+        for data_model_metadata in metadata:
+            if 'dataModel' in data_model_metadata and 'yamlUrl' in data_model_metadata:
+                yaml_links.setdefault(data_model_metadata['dataModel'], data_model_metadata['yamlUrl'])
+
+        links = dict()
+        for entity_name, yaml_link in yaml_links.items():
+            subject = official_data_models.get(entity_name)
+            if subject is None or 'repoLink' not in subject:
+                continue
+
+            entity_repo_link = subject['repoLink'].replace('.git', '')
+            entity_repo_link = join(entity_repo_link, 'tree', 'master', entity_name)
+
+            links[entity_name] = {
+                'entity_repo_link': entity_repo_link,
+                'entity_yaml_link': yaml_link,
+                'subject': subject.get('repoName')
+            }
+
+        return links
 
     @staticmethod
-    def __get_data__(url: str) -> dict:
+    def sort_entities(links: dict) -> list:
+        return sorted(((entity_name.lower(), entity_name, entity_links) for entity_name, entity_links in links.items()),
+                      key=itemgetter(0))
+
+    def search_entities(self, prefix: str, offset: int = 0, limit: int = 20) -> [dict, None]:
+        """
+        Search the entities whose name starts with the prefix (case insensitive), sorted by name
+        :param prefix: The beginning of the entity names
+        :param offset: Number of matching entities to skip
+        :param limit: Maximum number of entities to return
+        :return: The total number of matching entities and the requested page of them with their subject and
+                 repository link, or None if the list of data models is not available yet
+        """
+        if self.links is None:
+            return None
+
+        sorted_entities = self.sorted_entities
+        prefix = prefix.lower()
+
+        # the matching entities are the ones between the prefix and the prefix followed by the greatest character
+        start = bisect_left(sorted_entities, prefix, key=itemgetter(0))
+        end = bisect_left(sorted_entities, prefix + chr(0x10FFFF), lo=start, key=itemgetter(0))
+
+        page = sorted_entities[min(start + offset, end):min(start + offset + limit, end)]
+
+        return {
+            "total": end - start,
+            "entities": [{"name": entity_name,
+                          "subject": entity_links.get("subject"),
+                          "repoLink": entity_links["entity_repo_link"]} for _, entity_name, entity_links in page]
+        }
+
+    @staticmethod
+    def __get_data__(url: str) -> [dict, list, None]:
         response = None
 
         try:
-            response = get(url=url, timeout=1)
+            response = http_client.get(url=url)
             response.raise_for_status()
         except HTTPError as errh:
             print("HTTP Error")
             print(errh.args[0])
+            return None
         except ConnectionError as conerr:
             print("Connection error")
             print(conerr)
+            return None
         except RequestException as errex:
             print("Exception request")
             print(errex)
+            return None
         except ReadTimeout as errrt:
             print("Time out")
             print(errrt)
+            return None
 
         try:
             response = response.json()
         except JSONDecodeError as e:
             print("JSONDecodeError")
             print(e)
+            response = None
 
         return response
 
-    def get_links(self, entity_name: str) -> dict:
+    def get_links(self, entity_name: str, timeout: float = None) -> [dict, None]:
         """
         Get the link to the repository and the link to the raw data of the model.yaml of the corresponding Data Model
         :param entity_name: The name of the entity to search the links in GitHub
-        :return:
+        :param timeout: Maximum number of seconds to wait for the list of data models if it is not available yet,
+                        None to wait until it is downloaded
+        :return: The links of the entity, or None if the entity is not in the official list of data models
+        :raise TimeoutError: if the list of data models is not available after timeout seconds
         """
         self.logger.info(f"Requesting links from entity '{entity_name}'")
 
         # Acquire the lock associated with the Condition
         with self.data_available:
             # Wait until data is available
-            while self.official_list_data_models_data == dict():
-                self.data_available.wait()
+            if not self.data_available.wait_for(lambda: self.links is not None, timeout=timeout):
+                raise TimeoutError(f"The list of data models is not available after {timeout} seconds")
 
-        data_model_metadata = \
-            [x for x in self.data_models_metadata_data if x['dataModel'] == entity_name]
+            links = self.links
 
-        official_data_model = \
-            [x for x in self.official_list_data_models_data['officialList'] if entity_name in x['dataModels']]
+        entity_links = links.get(entity_name)
 
-        entity_repo_link = official_data_model[0]['repoLink']
-        entity_repo_link = entity_repo_link.replace('.git', '')
-        entity_repo_link = join(entity_repo_link, 'tree', 'master', entity_name)
-
-        entity_yaml_link = data_model_metadata[0]['yamlUrl']
+        if entity_links is None:
+            self.logger.info(f"Entity '{entity_name}' not found in the official list of data models")
+            return None
 
         response = {
-            'entity_repo_link': entity_repo_link,
-            'entity_yaml_link': entity_yaml_link
+            'entity_repo_link': entity_links['entity_repo_link'],
+            'entity_yaml_link': entity_links['entity_yaml_link']
         }
 
         return response
 
+    def stats(self) -> dict:
+        links = self.links
+
+        return {
+            "entities": len(links) if links is not None else 0,
+            "source": self.source,
+            "revalidated": self.revalidated,
+            "obtained_time": str(self.obtained_time) if links is not None else None,
+            "failed_downloads": self.failed_downloads,
+            "thread_alive": self.background_thread.is_alive()
+        }
+
     def stop(self):
         """
         Send the message to stop the thread
@@ -152,14 +316,14 @@ class SDMLinks:
 
         # Wait for the thread to finish
         self.background_thread.join()
-        self.background_thread.join()
 
         self.logger.debug("SDMLinks::Thread has been stopped.")
 
 
 if __name__ == '__main__':
     sdm_links = SDMLinks()
-    repo_link, yaml_link = sdm_links.get_links(entity_name='WeatherObserved')
+    links = sdm_links.get_links(entity_name='WeatherObserved')
+    sdm_links.stop()
 
-    print(f"Repository link: {repo_link}")
-    print(f"Yaml link: {yaml_link}")
+    print(f"Repository link: {links['entity_repo_link']}")
+    print(f"Yaml link: {links['entity_yaml_link']}")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# JSON Schema meta-schema used to validate the schema.json files. The draft 2020-12
+# meta-schemas are shipped under smartdatamodels/meta_schemas, loaded once at startup
+# and their validator is compiled once and reused by all the runs. The remote url is
+# only used to refresh them.
+
+from os.path import join, dirname, abspath, exists
+from urllib.parse import urlparse
+from json import load
+from threading import Lock
+from jsonschema import Draft202012Validator
+from jsonschema.validators import validator_for
+from jsonschema.exceptions import best_match
+from common.config import CONFIG_DATA
+from smartdatamodels.SDMHttpClient import http_client
+
+META_SCHEMAS_HOME = join(dirname(abspath(__file__)), "meta_schemas")
+
+
+class SDMMetaSchema:
+    def __init__(self, url: str, refresh: bool = False):
+        self.url = url
+        self.lock = Lock()
+
+        self.schema, self.source = self.load(refresh=refresh)
+        self.validator = self.compile(self.schema)
+
+    @staticmethod
+    def vendored_path(url: str) -> [str, None]:
+        """
+        Path of the vendored copy of a json-schema.org meta-schema
+
+        Examples:
+        >>> SDMMetaSchema.vendored_path("https://json-schema.org/draft/2020-12/meta/validation")
+        ".../smartdatamodels/meta_schemas/draft/2020-12/meta/validation.json"
+        """
+        parsed_url = urlparse(url)
+        if parsed_url.netloc != "json-schema.org":
+            return None
+
+        path = join(META_SCHEMAS_HOME, *parsed_url.path.strip("/").split("/"))
+        if not path.endswith(".json"):
+            path += ".json"
+
+        return path
+
+    def load(self, refresh: bool = False) -> [dict, str]:
+        """
+        Load the meta-schema from the vendored copy, or from the remote url if refresh is requested
+        or there is no vendored copy of it
+        """
+        path = self.vendored_path(self.url)
+        vendored = path is not None and exists(path)
+
+        if refresh or not vendored:
+            try:
+                return self.download(), "remote"
+            except Exception as e:
+                if not vendored:
+                    raise e
+                print(f"Unable to refresh the meta-schema from {self.url}, using the vendored copy. {e}")
+
+        with open(path, "r") as file:
+            return load(file), "vendored"
+
+    def download(self) -> dict:
+        response = http_client.get(self.url)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def compile(schema: dict):
+        """
+        Select the validator class of the meta-schema, check it and create its validator
+        """
+        validator_class = validator_for(schema, default=Draft202012Validator)
+        validator_class.check_schema(schema)
+        return validator_class(schema, format_checker=Draft202012Validator.FORMAT_CHECKER)
+
+    def refresh(self):
+        """
+        Download again the meta-schema from the remote url and replace the compiled validator
+        """
+        schema = self.download()
+        validator = self.compile(schema)
+
+        with self.lock:
+            self.schema, self.validator, self.source = schema, validator, "remote"
+
+    def validate(self, instance):
+        """
+        Validate the instance against the meta-schema, raising the same error as jsonschema.validate
+        """
+        error = best_match(self.validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+
+sdm_meta_schema = SDMMetaSchema(url=CONFIG_DATA["meta_schema"], refresh=CONFIG_DATA.get("meta_schema_refresh", False))
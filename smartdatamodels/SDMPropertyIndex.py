@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Index of the smart data models properties database (smartdatamodels.gz), built once
+# when the database is loaded. Each property name is mapped to the data models, the
+# descriptions and the types where it is already used, so that checking a schema costs
+# one hash lookup per property.
+#
+# The database repeats the same data model names, types and descriptions thousands of
+# times, so the index is stored in columns: every distinct string is kept once in a
+# table and the entries are arrays of integer codes into these tables.
+#
+# SDMPropertyDBIndex is the on-disk alternative: the database is converted once into a
+# SQLite file keyed by property name, which is queried lazily and shared through the OS
+# page cache by all the processes (uvicorn workers, command line runs) of the host.
+
+from array import array
+from sys import getsizeof, intern
+from os import remove, replace, getpid
+from os.path import exists, getmtime, getsize
+from gzip import GzipFile
+from io import TextIOWrapper
+from json import JSONDecoder, JSONDecodeError
+from threading import local
+import sqlite3
+
+
+# keys of the database entries kept in the indexes
+PROPERTY_KEYS = ('property', 'dataModel', 'description', 'type')
+
+JSON_WHITESPACE = ' \t\r\n'
+
+
+def iter_json_array(reader, keys=None, chunk_size: int = 65536):
+    """
+    Parse incrementally the items of the JSON array read from the text stream, so that only one
+    chunk of the stream and one item are kept in memory. If keys are provided, the items (objects)
+    are reduced to these keys.
+    """
+    decoder = JSONDecoder()
+    buffer = reader.read(chunk_size)
+    position = 0
+    end_of_stream = False
+
+    # the leading whitespace may span several chunks
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_WHITESPACE:
+            position += 1
+
+        if position < len(buffer):
+            break
+
+        buffer, position = reader.read(chunk_size), 0
+        if buffer == '':
+            break
+
+    if buffer[position:position + 1] != '[':
+        raise ValueError("The database file does not contain a JSON array")
+    position += 1
+
+    while True:
+        # skip the separators until the next item or the end of the array
+        while position < len(buffer) and buffer[position] in JSON_WHITESPACE + ',':
+            position += 1
+
+        if position == len(buffer):
+            if end_of_stream:
+                raise ValueError("Unexpected end of the database file")
+
+            chunk = reader.read(chunk_size)
+            end_of_stream = chunk == ''
+            buffer, position = chunk, 0
+            continue
+
+        if buffer[position] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+            # an item which is not followed by a separator may be truncated (e.g. a number)
+            complete = (end < len(buffer) and buffer[end] in JSON_WHITESPACE + ',]') or end_of_stream
+        except JSONDecodeError:
+            if end_of_stream:
+                raise
+            complete = False
+
+        if not complete:
+            chunk = reader.read(chunk_size)
+            end_of_stream = chunk == ''
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        position = end
+
+        if keys is not None and isinstance(item, dict):
+            item = {key: item[key] for key in keys if key in item}
+
+        yield item
+
+
+def iter_database(gz_path: str, keys=PROPERTY_KEYS):
+    """
+    Read incrementally the entries of the properties database file (smartdatamodels.gz), keeping
+    only the keys used by the indexes
+    """
+    with open(gz_path, "rb") as file:
+        # the file is compressed once, but it was compressed twice by previous versions of
+        # SDMProperties.download_file and it is not compressed if the server sent it with
+        # a gzip content encoding (decoded by requests)
+        stream = file
+        while stream.peek(2)[:2] == b'\x1f\x8b':
+            stream = GzipFile(fileobj=stream, mode="rb")
+
+        yield from iter_json_array(TextIOWrapper(stream, encoding="utf-8"), keys=keys)
+
+
+class SDMPropertyEntries:
+    """
+    Entries of one property, decoded from the index when the property is looked up
+    """
+    __slots__ = ('data_models', 'descriptions', 'types', 'distinct_types')
+
+    def __init__(self, data_models, descriptions, types, distinct_types):
+        self.data_models = data_models
+        self.descriptions = descriptions
+        self.types = types
+        self.distinct_types = distinct_types
+
+
+class SDMStringTable:
+    """
+    Table of distinct strings, each string is identified by its integer code
+    """
+    __slots__ = ('strings', 'codes')
+
+    def __init__(self):
+        self.strings = list()
+        self.codes = dict()
+
+    def encode(self, string) -> int:
+        # the values which are not strings (e.g. a list of types) are stored as text, like the SQLite backend does
+        if not isinstance(string, str):
+            string = str(string)
+
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            string = intern(string)
+            self.strings.append(string)
+            self.codes[string] = code
+
+        return code
+
+    def release(self):
+        # the codes are only needed while the index is built
+        self.codes = None
+
+
+class SDMPropertyIndex:
+    def __init__(self, entries):
+        """
+        Build the index from the entries of the database, dicts with the keys property, dataModel,
+        description and type
+        """
+        self.data_model_table = SDMStringTable()
+        self.description_table = SDMStringTable()
+        self.type_table = SDMStringTable()
+        self.type_set_table = list()
+
+        # property name -> position of the property in the columns below
+        self.properties = dict()
+
+        # per property: first entry, number of entries and code of its set of distinct types
+        self.offsets = array('I')
+        self.counts = array('I')
+        self.type_sets = array('I')
+
+        # per entry, grouped by property: codes of the data model, the description and the type
+        self.entry_data_models = array('I')
+        self.entry_descriptions = array('I')
+        self.entry_types = array('I')
+
+        self.build(entries)
+
+    def build(self, entries):
+        """
+        The entries are read only once, possibly from a stream, and encoded in the order in which they
+        appear. Then they are grouped by property with a counting sort, so that no object is created
+        per entry while the index is built.
+        """
+        entry_properties = array('I')
+        data_models = array('I')
+        descriptions = array('I')
+        types = array('I')
+
+        for entry in entries:
+            if 'property' not in entry:
+                continue
+
+            property_name = intern(str(entry['property']))
+            position = self.properties.get(property_name)
+            if position is None:
+                position = len(self.properties)
+                self.properties[property_name] = position
+
+            entry_properties.append(position)
+            data_models.append(self.data_model_table.encode(entry.get('dataModel', 'missing data model')))
+            descriptions.append(self.description_table.encode(entry.get('description', 'missing description')))
+            types.append(self.type_table.encode(entry.get('type', 'missing type')))
+
+        self.counts = array('I', bytes(4 * len(self.properties)))
+        for position in entry_properties:
+            self.counts[position] += 1
+
+        self.offsets = array('I', bytes(4 * len(self.properties)))
+        offset = 0
+        for position, count in enumerate(self.counts):
+            self.offsets[position] = offset
+            offset += count
+
+        # move each entry to the next free slot of its property, keeping the order in which they appear
+        next_slots = array('I', self.offsets)
+        self.entry_data_models = array('I', bytes(4 * len(entry_properties)))
+        self.entry_descriptions = array('I', bytes(4 * len(entry_properties)))
+        self.entry_types = array('I', bytes(4 * len(entry_properties)))
+
+        for entry_position, position in enumerate(entry_properties):
+            slot = next_slots[position]
+            next_slots[position] = slot + 1
+            self.entry_data_models[slot] = data_models[entry_position]
+            self.entry_descriptions[slot] = descriptions[entry_position]
+            self.entry_types[slot] = types[entry_position]
+
+        del entry_properties, data_models, descriptions, types, next_slots
+
+        # different types of each property, keeping the order in which they appear
+        type_set_codes = dict()
+        for position in range(len(self.properties)):
+            start = self.offsets[position]
+            type_set = tuple(dict.fromkeys(self.entry_types[start:start + self.counts[position]]))
+            if type_set not in type_set_codes:
+                type_set_codes[type_set] = len(self.type_set_table)
+                self.type_set_table.append(type_set)
+            self.type_sets.append(type_set_codes[type_set])
+
+        self.data_model_table.release()
+        self.description_table.release()
+        self.type_table.release()
+
+    def lookup(self, property_name) -> [SDMPropertyEntries, None]:
+        position = self.properties.get(property_name)
+        if position is None:
+            return None
+
+        start = self.offsets[position]
+        end = start + self.counts[position]
+
+        data_models = self.data_model_table.strings
+        descriptions = self.description_table.strings
+        types = self.type_table.strings
+
+        return SDMPropertyEntries(
+            data_models=[data_models[code] for code in self.entry_data_models[start:end]],
+            descriptions=[descriptions[code] for code in self.entry_descriptions[start:end]],
+            types=[types[code] for code in self.entry_types[start:end]],
+            distinct_types=[types[code] for code in self.type_set_table[self.type_sets[position]]])
+
+    def __len__(self):
+        return len(self.entry_data_models)
+
+    def property_count(self) -> int:
+        return len(self.properties)
+
+    def memory_usage(self) -> int:
+        """
+        Approximate number of bytes used by the index, the objects shared by several entries
+        are counted only once
+        """
+        return deep_size_of(self)
+
+
+class SDMPropertyDBIndex:
+    def __init__(self, db_path: str):
+        """
+        Open (read only) the SQLite index of the database created by SDMPropertyDBIndex.build
+        """
+        self.db_path = db_path
+
+        # sqlite3 connections cannot be shared between threads, each thread opens its own one
+        self.connections = local()
+
+        connection = self.connection()
+        self.entry_count = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        self.properties_count = connection.execute("SELECT COUNT(DISTINCT property) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def is_up_to_date(db_path: str, gz_path: str) -> bool:
+        """
+        Check whether the SQLite index was built from the current version of the database file
+        """
+        if not exists(db_path):
+            return False
+
+        try:
+            connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                source = dict(connection.execute("SELECT key, value FROM source").fetchall())
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return False
+
+        return source.get("mtime") == str(getmtime(gz_path)) and source.get("size") == str(getsize(gz_path))
+
+    @staticmethod
+    def build(db_path: str, gz_path: str, entries=None):
+        """
+        Convert the database file into a SQLite index. The index is written in a temporary file
+        that replaces the previous one once it is complete, so the processes reading the
+        previous index are not affected.
+        """
+        if entries is None:
+            entries = iter_database(gz_path)
+
+        temporary_path = f"{db_path}.{getpid()}.tmp"
+        if exists(temporary_path):
+            remove(temporary_path)
+
+        connection = sqlite3.connect(temporary_path)
+        try:
+            connection.execute("CREATE TABLE source (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("CREATE TABLE entries (property TEXT NOT NULL, dataModel TEXT, "
+                               "description TEXT, type TEXT)")
+
+            connection.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                ((str(entry['property']),
+                  str(entry.get('dataModel', 'missing data model')),
+                  str(entry.get('description', 'missing description')),
+                  str(entry.get('type', 'missing type'))) for entry in entries if 'property' in entry))
+
+            connection.execute("CREATE INDEX entries_property ON entries (property)")
+            connection.executemany("INSERT INTO source VALUES (?, ?)",
+                                   [("mtime", str(getmtime(gz_path))), ("size", str(getsize(gz_path)))])
+            connection.commit()
+        finally:
+            connection.close()
+
+        replace(temporary_path, db_path)
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.connections, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            self.connections.connection = connection
+
+        return connection
+
+    def lookup(self, property_name) -> [SDMPropertyEntries, None]:
+        rows = self.connection().execute(
+            "SELECT dataModel, description, type FROM entries WHERE property = ? ORDER BY rowid",
+            (property_name,)).fetchall()
+
+        if len(rows) == 0:
+            return None
+
+        types = [row[2] for row in rows]
+
+        return SDMPropertyEntries(data_models=[row[0] for row in rows],
+                                  descriptions=[row[1] for row in rows],
+                                  types=types,
+                                  distinct_types=list(dict.fromkeys(types)))
+
+    def __len__(self):
+        return self.entry_count
+
+    def property_count(self) -> int:
+        return self.properties_count
+
+    def memory_usage(self) -> int:
+        # the entries stay on disk, only the connections are kept in memory
+        return 0
+
+
+def deep_size_of(obj, seen=None) -> int:
+    """
+    Approximate number of bytes used by the object and all the objects that it contains
+    """
+    if seen is None:
+        seen = set()
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size_of(key, seen) + deep_size_of(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size_of(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size_of(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    elif hasattr(obj, '__dict__'):
+        size += deep_size_of(vars(obj), seen)
+
+    return size
+
+
+if __name__ == '__main__':
+    # Benchmark: bytes per entry of the list of dicts previously kept in memory and of the index,
+    # and peak memory while the index is built from the database file
+    from sys import argv
+    from os.path import join
+    from time import time
+    from tracemalloc import start, stop, get_traced_memory
+    from common.config import CODE_HOME
+
+    gz_path = argv[1] if len(argv) > 1 else join(CODE_HOME, "mastercheck_output", "smartdatamodels.gz")
+
+    start()
+    start_time = time()
+    index = SDMPropertyIndex(iter_database(gz_path))
+    build_time = time() - start_time
+    _, build_peak = get_traced_memory()
+    stop()
+
+    index_size = index.memory_usage()
+
+    list_of_dicts = list(iter_database(gz_path))
+    list_of_dicts_size = deep_size_of(list_of_dicts)
+
+    print(f"Entries: {len(list_of_dicts)}, properties: {len(index.properties)}, "
+          f"data models: {len(index.data_model_table.strings)}, types: {len(index.type_table.strings)}, "
+          f"descriptions: {len(index.description_table.strings)}")
+    print(f"List of dicts: {list_of_dicts_size} bytes, {list_of_dicts_size / len(list_of_dicts):.1f} bytes per entry")
+    print(f"Index: {index_size} bytes, {index_size / max(len(index), 1):.1f} bytes per entry, "
+          f"built in {build_time:.2f} seconds with a peak of {build_peak} bytes")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Process-wide store of the documents referenced by $ref (common-schema.json, GSMA
+# definitions...). Almost all the data models reference the same few documents, so
+# they are downloaded and parsed once and kept in memory for ttl_seconds.
+
+from threading import Lock
+from time import monotonic
+from common.config import CONFIG_DATA
+from smartdatamodels.SDMHttpClient import http_client
+from smartdatamodels.SDMFetchCache import response_digest
+
+
+class SDMRefStore:
+    def __init__(self, ttl_seconds: float = 3600, max_documents: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+
+        # uri -> (expiration time, parsed document, digest of the response)
+        self.documents = dict()
+        self.uri_locks = dict()
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+
+    def load(self, uri: str, fetch=None):
+        """
+        Get the parsed document of the uri, downloading it with fetch (the shared HTTP client by default)
+        only if it is not in the store or it has expired. The documents returned are shared, they must not
+        be modified.
+        """
+        return self.load_entry(uri, fetch=fetch)[0]
+
+    def load_entry(self, uri: str, fetch=None) -> tuple:
+        """
+        Get the (parsed document, digest of the response) of the uri as load does, the digest is the one of
+        the response from which the document was parsed, which may be older than the current one
+        """
+        if fetch is None:
+            fetch = http_client.get
+
+        with self.lock:
+            uri_lock = self.uri_locks.setdefault(uri, Lock())
+
+        # concurrent loads of the same uri wait for the first download
+        with uri_lock:
+            with self.lock:
+                entry = self.documents.get(uri)
+
+                if entry is not None:
+                    if entry[0] > monotonic():
+                        self.hits += 1
+                        return entry[1], entry[2]
+
+                    self.documents.pop(uri)
+                    self.expirations += 1
+
+            # failed downloads raise and are not stored
+            response = fetch(uri)
+            document = response.json()
+            digest = response_digest(response)
+
+            with self.lock:
+                self.misses += 1
+                self.documents[uri] = (monotonic() + self.ttl_seconds, document, digest)
+
+                if len(self.documents) > self.max_documents:
+                    # forget the document that expires first
+                    oldest_uri = min(self.documents, key=lambda key: self.documents[key][0])
+                    self.documents.pop(oldest_uri)
+
+        return document, digest
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "documents": len(self.documents),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations
+            }
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.uri_locks.clear()
+
+
+ref_store_config = CONFIG_DATA.get("ref_store", dict())
+
+ref_store = SDMRefStore(ttl_seconds=ref_store_config.get("ttl_seconds", 3600),
+                        max_documents=ref_store_config.get("max_documents", 256))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Cache of the results of the checks, stored in a local SQLite database and keyed by
+# the content of the files that each check read (schema.json, examples, $ref documents,
+# other files) and by the version of the tool (source code and settings). The next run
+# of a check of the same data model downloads these files again (revalidated by the HTTP
+# cache) and reuses the previous result if none of them changed, whoever requested it.
+# A changed file only invalidates the checks that read it. The outputs are saved without
+# the data of the requester (mail, links to its output file), which are added back for
+# the requester of the next run.
+
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from json import dumps, loads
+from os import makedirs
+from os.path import dirname, join
+from pathlib import Path
+from threading import local, Lock
+from time import time
+from common.config import CONFIG_DATA, CODE_HOME, __version__
+import sqlite3
+
+# settings which do not change the verdict of a test, they are left out of the cache keys
+OPERATIONAL_SETTINGS = ["logger", "meta_schema_refresh", "validator_cache_size", "properties", "links_timeout_seconds",
+                        "executor", "jobs", "result_cache", "events", "ref_store", "json_output_dir", "progress_file",
+                        "http", "http_cache", "certfile", "keyfile"]
+
+# placeholder of the mail of the requester in the saved outputs
+MAIL_PLACEHOLDER = "{{sdm:mail}}"
+
+# keys of the outputs which are created for each requester, they are not saved
+REQUESTER_KEYS = ["jsonUrl"]
+
+
+def anonymize(output, mail: str):
+    """
+    Copy of the output of a test without the data of its requester: the mail is replaced by a placeholder and
+    the keys created for each requester are removed
+    """
+    if isinstance(output, dict):
+        return {anonymize(key, mail): anonymize(value, mail)
+                for key, value in output.items() if key not in REQUESTER_KEYS}
+
+    if isinstance(output, list):
+        return [anonymize(value, mail) for value in output]
+
+    if isinstance(output, str):
+        return output.replace(mail, MAIL_PLACEHOLDER)
+
+    return output
+
+
+def personalize(output, mail: str):
+    """
+    Copy of a saved output with the mail of the current requester in place of the placeholder
+    """
+    if isinstance(output, dict):
+        return {personalize(key, mail): personalize(value, mail) for key, value in output.items()}
+
+    if isinstance(output, list):
+        return [personalize(value, mail) for value in output]
+
+    if isinstance(output, str):
+        return output.replace(MAIL_PLACEHOLDER, mail)
+
+    return output
+
+
+def is_anonymizable(mail: str) -> bool:
+    """
+    A mail which could be part of other text of the output (empty, not an address) cannot be replaced safely
+    """
+    return isinstance(mail, str) and "@" in mail
+
+
+def tool_version() -> str:
+    """
+    Digest of the version of the tool, its source code and the settings which may change the verdicts, so that
+    a fix of the checks or a change of configuration invalidates the cached results
+    """
+    digest = sha256(__version__.encode())
+
+    code_home = Path(CODE_HOME)
+    for source in sorted(list(code_home.glob("smartdatamodels/*.py")) + list(code_home.glob("common/*.py"))):
+        digest.update(source.relative_to(code_home).as_posix().encode())
+        digest.update(source.read_bytes())
+
+    settings = {key: value for key, value in CONFIG_DATA.items() if key not in OPERATIONAL_SETTINGS}
+    digest.update(dumps(settings, sort_keys=True, default=str).encode())
+
+    return digest.hexdigest()
+
+
+class SDMResultCache:
+    def __init__(self, db_path: str, ttl_seconds: float = 604800, enabled: bool = True):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+        # sqlite3 connections cannot be shared between threads, each thread opens its own one
+        self.connections = local()
+        self.initialized = False
+
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stored = 0
+        self.uncacheable = 0
+
+        self.version = tool_version()
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.connections, "connection", None)
+        if connection is None:
+            # the database is created by the first run, not when the module is imported
+            if dirname(self.db_path):
+                makedirs(dirname(self.db_path), exist_ok=True)
+
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self.connections.connection = connection
+
+            with self.lock:
+                if not self.initialized:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute("""
+                        CREATE TABLE IF NOT EXISTS results (
+                            data_model TEXT NOT NULL,
+                            test INTEGER NOT NULL,
+                            key TEXT NOT NULL,
+                            dependencies TEXT NOT NULL,
+                            result INTEGER NOT NULL,
+                            output TEXT NOT NULL,
+                            created REAL NOT NULL,
+                            PRIMARY KEY (data_model, test)
+                        )""")
+                    self.initialized = True
+
+        return connection
+
+    def key(self, test_number: int, dependencies: list, inputs: dict = None) -> str:
+        """
+        Hash of the version of the tool, the test and the [method, url, digest] of its dependencies
+        """
+        content = dumps([self.version, test_number, sorted(dependencies), inputs or dict()], sort_keys=True)
+
+        return sha256(content.encode()).hexdigest()
+
+    @staticmethod
+    def digests(dependencies: dict, fetch_cache) -> list:
+        """
+        [method, url, digest] of the {(method, url): digest} dependencies. The digests which are not known (the
+        ones of the files not served by the ref store) are requested through the fetch cache of the run.
+        """
+        if len(dependencies) == 0:
+            return list()
+
+        keys = sorted(dependencies)
+
+        def digest(key):
+            if dependencies[key] is not None:
+                return dependencies[key]
+
+            return fetch_cache.digest(url=key[1], method=key[0])
+
+        with ThreadPoolExecutor(max_workers=min(8, len(keys))) as executor:
+            return [[method, url, digest] for (method, url), digest in zip(keys, executor.map(digest, keys))]
+
+    def lookup(self, data_model: str, test_number: int, fetch_cache, mail: str,
+               inputs: dict = None) -> [tuple, None]:
+        """
+        Return the (result, output) of the previous run of the test if the files that it read have not changed,
+        None otherwise. The output is returned with the mail of the current requester.
+        """
+        if not self.enabled or not is_anonymizable(mail):
+            return None
+
+        row = self.connection().execute("SELECT * FROM results WHERE data_model = ? AND test = ? AND created > ?",
+                                        (data_model, test_number, time() - self.ttl_seconds)).fetchone()
+
+        if row is None:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # the current digests of the files, a file changed since the store served it invalidates the result
+        dependencies = self.digests({(method, url): None for method, url, _ in loads(row["dependencies"])},
+                                    fetch_cache)
+
+        if any(digest is None for _, _, digest in dependencies) or \
+                self.key(test_number, dependencies, inputs) != row["key"]:
+            with self.lock:
+                self.invalidations += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+
+        return bool(row["result"]), personalize(loads(row["output"]), mail)
+
+    def store(self, data_model: str, test_number: int, result: bool, output, dependencies: dict, fetch_cache,
+              mail: str, inputs: dict = None):
+        """
+        Save the result of a test with the digests of the files that it read (as they were served to it), and its
+        output without the data of the requester. The result is not saved if one of them could not be downloaded, the test may give another
+        result the next time.
+        """
+        if not self.enabled:
+            return
+
+        if not is_anonymizable(mail):
+            with self.lock:
+                self.uncacheable += 1
+            return
+
+        dependencies = self.digests(dependencies, fetch_cache)
+
+        if any(digest is None for _, _, digest in dependencies):
+            with self.lock:
+                self.uncacheable += 1
+            return
+
+        connection = self.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO results (data_model, test, key, dependencies, result, output, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (data_model, test_number, self.key(test_number, dependencies, inputs), dumps(dependencies),
+             int(bool(result)), dumps(anonymize(output, mail), default=str), time()))
+
+        connection.execute("DELETE FROM results WHERE created < ?", (time() - self.ttl_seconds,))
+
+        with self.lock:
+            self.stored += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "database": self.db_path,
+                "version": self.version,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "stored": self.stored,
+                "uncacheable": self.uncacheable
+            }
+
+    def close(self):
+        connection = getattr(self.connections, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.connections.connection = None
+
+
+result_cache_config = CONFIG_DATA.get("result_cache", dict())
+
+result_cache = SDMResultCache(
+    db_path=result_cache_config.get("database") or join(CODE_HOME, "mastercheck_output", "results.sqlite"),
+    ttl_seconds=result_cache_config.get("ttl_seconds", 604800),
+    enabled=result_cache_config.get("enabled", True))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+# Bounded LRU of ready-built jsonschema validators, keyed by a stable hash of the
+# content of the schema, so that the examples of a data model (and the next runs of
+# an unchanged data model) reuse the same validator instead of building a new one.
+# The "closed" variant of a schema, which does not allow additional properties, is
+# derived once and cached alongside the open one.
+
+from collections import OrderedDict
+from hashlib import sha256
+from json import dumps
+from threading import Lock
+from jsonschema import Draft202012Validator
+from jsonschema.validators import validator_for
+from jsonschema.exceptions import best_match
+from common.config import CONFIG_DATA
+
+
+class SDMValidatorCache:
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self.validators = OrderedDict()
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def schema_hash(schema, format_checker: bool = True, closed: bool = False) -> str:
+        """
+        Stable hash of the content of the schema and the validation settings. The jsonref proxies
+        are dereferenced, so two schemas with the same resolved content get the same hash.
+        Raise ValueError if the schema is recursive.
+        """
+        content = dumps(schema, sort_keys=True, default=lambda o: o.__subject__)
+        return sha256(f"{format_checker}:{closed}:{content}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def flatten_all_of(schema) -> dict:
+        """
+        Merge the properties of all the (nested) allOf items of the schema into a single properties dict
+        """
+        flatten_schema = dict()
+        flatten_schema["properties"] = dict()
+        for item in schema["allOf"]:
+            if "allOf" in item:
+                flatten_schema["properties"] = \
+                    dict(flatten_schema["properties"], **SDMValidatorCache.flatten_all_of(item)["properties"])
+
+            if "properties" in item:
+                flatten_schema["properties"] = dict(flatten_schema["properties"], **item["properties"])
+
+        return flatten_schema
+
+    @staticmethod
+    def close_schema(schema) -> dict:
+        """
+        Create the variant of the schema that does not allow additional properties, the allOf items
+        are flattened so that additionalProperties applies to all the properties of the data model.
+        The schema received is not modified.
+        """
+        closed_schema = dict(schema)
+
+        if "allOf" in schema:
+            flatten_schema = SDMValidatorCache.flatten_all_of(schema)
+            flatten_schema["additionalProperties"] = False
+            closed_schema["allOf"] = [flatten_schema]
+        elif "properties" in schema:
+            closed_schema["additionalProperties"] = False
+
+        return closed_schema
+
+    @staticmethod
+    def build(schema, format_checker: bool = True, closed: bool = False):
+        """
+        Select the validator class of the schema, check the schema and create its validator,
+        as jsonschema.validate does. Raise SchemaError if the schema is not valid.
+        """
+        if closed:
+            schema = SDMValidatorCache.close_schema(schema)
+
+        validator_class = validator_for(schema, default=Draft202012Validator)
+        validator_class.check_schema(schema)
+
+        if format_checker:
+            return validator_class(schema, format_checker=Draft202012Validator.FORMAT_CHECKER)
+        else:
+            return validator_class(schema)
+
+    def get(self, schema, format_checker: bool = True, closed: bool = False):
+        """
+        Get the validator of the schema, or of its closed variant, building it only if it is not in the cache
+        """
+        try:
+            key = self.schema_hash(schema, format_checker, closed)
+        except ValueError:
+            # recursive schema, it cannot be hashed and it is not cached
+            return self.build(schema, format_checker, closed)
+
+        with self.lock:
+            if key in self.validators:
+                self.validators.move_to_end(key)
+                self.hits += 1
+                return self.validators[key]
+
+        validator = self.build(schema, format_checker, closed)
+
+        with self.lock:
+            self.misses += 1
+            self.validators[key] = validator
+            self.validators.move_to_end(key)
+
+            while len(self.validators) > self.max_size:
+                self.validators.popitem(last=False)
+
+        return validator
+
+    def validate(self, instance, schema, format_checker: bool = True, closed: bool = False):
+        """
+        Validate the instance against the schema, or against its closed variant, raising the same errors
+        as jsonschema.validate
+        """
+        error = best_match(self.get(schema, format_checker, closed).iter_errors(instance))
+        if error is not None:
+            raise error
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "validators": len(self.validators),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def clear(self):
+        with self.lock:
+            self.validators.clear()
+
+
+validator_cache = SDMValidatorCache(max_size=CONFIG_DATA.get("validator_cache_size", 64))
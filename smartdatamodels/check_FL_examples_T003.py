@@ -25,7 +25,8 @@ from smartdatamodels.MD_exist import MDExist
 
 
 class CheckExamples:
-    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False):
+    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False,
+                 fetch_cache=None, events=None):
         # FL stands for inside file check for one data model
         # this python file is focused on files under the examples folder
         # TODO: include geojson example in the future
@@ -41,8 +42,9 @@ class CheckExamples:
         self.json_output_filepath = json_output_filepath
         self.generate_output_file = generate_output_file
 
-        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file)
-        self.md_exist = MDExist(logger=logger, generate_output_file=generate_output_file)
+        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache,
+                                  events=events)
+        self.md_exist = MDExist(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache)
 
     def check_fl_examples(self, tz, test_number) -> [bool, dict]:
         """
@@ -27,7 +27,8 @@ from smartdatamodels.utils import SDMUtils
 # this python file is focused on other files
 # like notes.yaml, ADOPTERS.yaml, CONTRIBUTORS.yaml, LICENSE.md
 class CheckOtherFiles:
-    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False):
+    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False,
+                 fetch_cache=None, events=None):
         self.CHECK_OTHERS = [
             "notes.yaml",
             "ADOPTERS.yaml",
@@ -39,7 +40,8 @@ class CheckOtherFiles:
         self.json_output_filepath = json_output_filepath
         self.generate_output_file = generate_output_file
 
-        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file)
+        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache,
+                                  events=events)
 
     def check_fl_others(self, tz, test_number) -> [bool, dict]:
         """
@@ -25,20 +25,23 @@
 
 from smartdatamodels.utils import SDMUtils
 from smartdatamodels.PC_well_documented import SDMWellDocumented
-from smartdatamodels.PC_exist_already import SDMProperties
+from smartdatamodels.PC_exist_already import get_sdm_properties
 from smartdatamodels.MD_reported import MDReported
 from smartdatamodels.MD_exist import MDExist
-from common.config import CONFIG_DATA
+from smartdatamodels.SDMMetaSchema import sdm_meta_schema
 import time
 
 
 class CheckSchema:
-    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False):
-        self.sdm_properties = SDMProperties(logger=logger)
-        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file)
+    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False,
+                 fetch_cache=None, events=None):
+        # properties database shared by all the runs of the process
+        self.sdm_properties = get_sdm_properties(logger=logger)
+        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache,
+                                  events=events)
         self.sdm_well_documented = SDMWellDocumented(logger=logger, generate_output_file=generate_output_file)
-        self.md_reported = MDReported(logger=logger, generate_output_file=generate_output_file)
-        self.md_exist = MDExist(logger=logger, generate_output_file=generate_output_file)
+        self.md_reported = MDReported(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache)
+        self.md_exist = MDExist(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache)
 
         self.logger = logger
         self.data_model_repo_url = data_model_repo_url
@@ -46,9 +49,6 @@ class CheckSchema:
         self.json_output_filepath = json_output_filepath
         self.generate_output_file = generate_output_file
 
-    def stop(self):
-        self.sdm_properties.stop()
-
     def check_fl_schema_json(self, test_number, tz) -> [bool, dict]:
         """
         Check file schema.json given the data model link
@@ -60,9 +60,6 @@ class CheckSchema:
 
         raw_schema_url = self.sdm_utils.get_schema_json_raw(self.data_model_repo_url)
 
-        meta_schema = CONFIG_DATA["meta_schema"]
-        meta_schema = self.sdm_utils.open_jsonref(meta_schema)
-
         # check the parameters
         # 1. whether schema.json file is readable
         # 2. whether $ref in schema.json is extendable
@@ -75,7 +72,8 @@ class CheckSchema:
                                                  schema_url=raw_schema_url,
                                                  mail=self.mail,
                                                  test=test_number,
-                                                 meta_schema=meta_schema,
+                                                 meta_schema=sdm_meta_schema.schema,
+                                                 meta_validator=sdm_meta_schema,
                                                  tag="Schema")
 
         # if result is false, then there exists mentioned errors
@@ -39,14 +39,16 @@ from smartdatamodels.utils import SDMUtils
 
 
 class CheckStructure:
-    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False):
+    def __init__(self, logger, data_model_repo_url, mail, json_output_filepath, generate_output_file=False,
+                 fetch_cache=None, events=None):
         self.logger = logger
         self.data_model_repo_url = data_model_repo_url
         self.mail = mail
         self.json_output_filepath = json_output_filepath
         self.generate_output_file = generate_output_file
 
-        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file)
+        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=generate_output_file, fetch_cache=fetch_cache,
+                                  events=events)
 
     # url: check whether return 200
     def check_fs_minimal(self, tz, test_number) -> [bool, dict]:
@@ -59,17 +61,14 @@ class CheckStructure:
 
         output = {"result": False}  # the json answering the test
 
-        examples = (
-            self.sdm_utils.is_url_existed(self.data_model_repo_url + "/examples"))[0]
-
-        schema_json = (
-            self.sdm_utils.is_url_existed(self.data_model_repo_url + "/schema.json"))[0]
-
-        normalized_json = (
-            self.sdm_utils.is_url_existed(self.data_model_repo_url + "/examples/example-normalized.json"))[0]
-
-        normalized_jsonld = (
-            self.sdm_utils.is_url_existed(self.data_model_repo_url + "/examples/example-normalized.jsonld"))[0]
+        # the four probes are sent concurrently as HEAD requests. The files are probed on their raw urls,
+        # the same ones later downloaded by tests 2 and 3
+        examples, schema_json, normalized_json, normalized_jsonld = self.sdm_utils.are_urls_reachable([
+            self.data_model_repo_url + "/examples",
+            self.sdm_utils.get_schema_json_raw(self.data_model_repo_url),
+            self.sdm_utils.create_example_url_raw(self.data_model_repo_url, "example-normalized.json"),
+            self.sdm_utils.create_example_url_raw(self.data_model_repo_url, "example-normalized.jsonld")
+        ])
 
         if not examples:
             output["cause"] = (f"{self.data_model_repo_url.split('/')[-1]} "
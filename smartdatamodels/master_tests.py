@@ -31,6 +31,10 @@ from smartdatamodels.check_FL_schema_T002 import CheckSchema
 from smartdatamodels.check_FS_T001 import CheckStructure
 from smartdatamodels.check_FL_examples_T003 import CheckExamples
 from smartdatamodels.check_FL_others_T004 import CheckOtherFiles
+from smartdatamodels.SDMFetchCache import SDMFetchCache
+from smartdatamodels.SDMRefStore import ref_store
+from smartdatamodels.SDMResultCache import result_cache
+from smartdatamodels.PC_exist_already import stop_sdm_properties
 from common.config import CONFIG_DATA
 
 
@@ -52,7 +56,7 @@ from common.config import CONFIG_DATA
 #   - last_test_number: the test that contributor wants to do, 0 by default which means fully test
 ################################################
 class SDMQualityTesting:
-    def __init__(self, data_model_repo_url, mail, last_test_number, logger):
+    def __init__(self, data_model_repo_url, mail, last_test_number, logger, events=None):
         meta_schema = CONFIG_DATA["meta_schema"]
         time_zone = CONFIG_DATA["timezone"]
         self.test_number = CONFIG_DATA["test_number"]
@@ -61,7 +65,16 @@ class SDMQualityTesting:
         self.logger = logger
         self.tz = timezone(time_zone)
 
-        self.sdm_utils = SDMUtils(logger=logger, generate_output_file=self.generate_output_file)
+        # remote files downloaded during this run, shared by all the checks
+        self.fetch_cache = SDMFetchCache()
+
+        # SDMEventChannel where the progress of the run is published, if any
+        self.events = events
+
+        self.sdm_utils = SDMUtils(logger=logger,
+                                  generate_output_file=self.generate_output_file,
+                                  fetch_cache=self.fetch_cache,
+                                  events=self.events)
 
         ################################################
         # Create output json file for tests
@@ -75,7 +88,9 @@ class SDMQualityTesting:
                                        data_model_repo_url=data_model_repo_url,
                                        mail=mail,
                                        json_output_filepath=self.json_output_filepath,
-                                       generate_output_file=self.generate_output_file)
+                                       generate_output_file=self.generate_output_file,
+                                       fetch_cache=self.fetch_cache,
+                                       events=self.events)
 
         check_fl_schema_json = self.checkSchema.check_fl_schema_json
 
@@ -83,19 +98,25 @@ class SDMQualityTesting:
                                               data_model_repo_url=data_model_repo_url,
                                               mail=mail,
                                               json_output_filepath=self.json_output_filepath,
-                                              generate_output_file=self.generate_output_file).check_file_structure
+                                              generate_output_file=self.generate_output_file,
+                                              fetch_cache=self.fetch_cache,
+                                              events=self.events).check_file_structure
 
         check_fl_examples = CheckExamples(logger=logger,
                                           data_model_repo_url=data_model_repo_url,
                                           mail=mail,
                                           json_output_filepath=self.json_output_filepath,
-                                          generate_output_file=self.generate_output_file).check_fl_examples
+                                          generate_output_file=self.generate_output_file,
+                                          fetch_cache=self.fetch_cache,
+                                          events=self.events).check_fl_examples
 
         check_fl_others = CheckOtherFiles(logger=logger,
                                           data_model_repo_url=data_model_repo_url,
                                           mail=mail,
                                           json_output_filepath=self.json_output_filepath,
-                                          generate_output_file=self.generate_output_file).check_fl_others
+                                          generate_output_file=self.generate_output_file,
+                                          fetch_cache=self.fetch_cache,
+                                          events=self.events).check_fl_others
 
         self.number_to_test_name = {
             1: check_file_structure,
@@ -188,7 +209,7 @@ class SDMQualityTesting:
                     flag = False
                     break
             if flag:
-                result, aux = test(tz=tz, test_number=test_number)
+                result, aux = self.run_test(test, test_number, tz)
                 self.output[str(test_number)] = aux
                 if result:
                     test_stats[1] += 1
@@ -200,6 +221,72 @@ class SDMQualityTesting:
 
         return test_stats
 
+    def run_test(self, test, test_number, tz):
+        """
+        Run a test, or reuse its result if none of the files that it read in a previous run has changed
+        """
+        inputs = self.test_inputs(test_number)
+
+        try:
+            cached = result_cache.lookup(data_model=self.data_model_repo_url,
+                                         test_number=test_number,
+                                         fetch_cache=self.fetch_cache,
+                                         mail=self.mail,
+                                         inputs=inputs)
+        except Exception as e:
+            self.logger.warning(f"The cached result of the test {test_number} could not be read: {e}")
+            cached = None
+
+        if cached is not None:
+            # the output returned by the test and the one that it wrote in the json output file
+            result, (aux, written) = cached
+            self.logger.info(f"Test {test_number} result reused, its files have not changed")
+
+            self.sdm_utils.reuse_json_dumps(output=written,
+                                            tz=tz,
+                                            test_number=test_number,
+                                            json_output_filepath=self.json_output_filepath,
+                                            mail=self.mail,
+                                            flag=result)
+
+            # the link to the output file of this requester
+            if isinstance(aux, dict) and "jsonUrl" in written:
+                aux["jsonUrl"] = written["jsonUrl"]
+
+            return result, aux
+
+        self.fetch_cache.start_recording()
+        try:
+            result, aux = test(tz=tz, test_number=test_number)
+        finally:
+            dependencies = self.fetch_cache.stop_recording()
+
+        try:
+            written = self.sdm_utils.read_output_json(self.json_output_filepath).get(str(test_number), aux)
+
+            result_cache.store(data_model=self.data_model_repo_url,
+                               test_number=test_number,
+                               result=result,
+                               output=[aux, written],
+                               dependencies=dependencies,
+                               fetch_cache=self.fetch_cache,
+                               mail=self.mail,
+                               inputs=self.test_inputs(test_number))
+        except Exception as e:
+            self.logger.warning(f"The result of the test {test_number} could not be cached: {e}")
+
+        return result, aux
+
+    def test_inputs(self, test_number) -> dict:
+        """
+        Inputs of a test which are not files of the data model
+        """
+        if test_number == 2:
+            # the schema.json check looks up the properties in the properties database
+            return {"properties": self.checkSchema.sdm_properties.version}
+
+        return dict()
+
     ################################################
     # Run the tests and send the sum up message
     ################################################
@@ -216,10 +303,14 @@ class SDMQualityTesting:
                                         tz=self.tz,
                                         check_type=message)
 
+        self.logger.debug(f"Fetch cache statistics: '{self.fetch_cache.stats()}'")
+        self.logger.debug(f"$ref store statistics: '{ref_store.stats()}'")
+
         return self.output
 
-    def stop(self):
+    @staticmethod
+    def stop():
         """
-        Send the message to stop the thread
+        Send the message to stop the thread of the properties database shared by all the runs of the process
         """
-        self.checkSchema.stop()
+        stop_sdm_properties()
@@ -21,23 +21,32 @@
 ##
 
 from json import load, dump, loads, JSONDecodeError
-from jsonref import loads as jsonref_loads
+from jsonref import loads as jsonref_loads, jsonloader, JsonRef
 from re import sub, match
-from requests import get
 from datetime import datetime, timezone, time
 from yaml import safe_load
 from yaml.scanner import ScannerError
 from common.config import CONFIG_DATA
 from validator_collection import checkers
-from jsonschema import validate, SchemaError, Draft202012Validator
+from jsonschema import SchemaError
 from jsonschema.exceptions import ValidationError
+from smartdatamodels.SDMHttpClient import http_client
+from smartdatamodels.SDMValidatorCache import validator_cache
+from smartdatamodels.SDMRefStore import ref_store
+from concurrent.futures import ThreadPoolExecutor
 
 
 class SDMUtils:
-    def __init__(self, logger, generate_output_file: bool = False):
+    def __init__(self, logger, generate_output_file: bool = False, fetch_cache=None, events=None):
         self.logger = logger
         self.generate_output_file = generate_output_file
 
+        # SDMFetchCache shared by the checks of the same run, None to always download the files
+        self.fetch_cache = fetch_cache
+
+        # SDMEventChannel of the run where the progress messages are published, None to not publish them
+        self.events = events
+
         self.propertyTypes = ["Property", "Relationship", "GeoProperty", "LanguageProperty"]
 
         self.TESTS = [
@@ -53,6 +62,8 @@ class SDMUtils:
 
         self.SUFFIX = "mastercheck"
 
+        self.CHECK_TYPES = ["start", "loading", "passed", "processing", "failed", "previous"]
+
         self.schema_json_yaml_dict = dict()
 
         self.example_v2_output_filepath = None
@@ -190,7 +201,12 @@ class SDMUtils:
         else:  # the return message when check ends
             message = self.mf_test_end(check_type)
 
-        if CONFIG_DATA["generate_output_file"]:
+        if self.events is not None:
+            event_type = check_type if check_type in self.CHECK_TYPES else "summary"
+            self.events.publish(event_type, {"test_number": test_number, "message": message})
+
+        # the text file read by the website is an optional sink of the messages
+        if CONFIG_DATA["generate_output_file"] and CONFIG_DATA.get("progress_file", True):
             self.write_msg_to_file(message, mail)
 
     def message_after_check_schema(self, output):
@@ -437,6 +453,32 @@ class SDMUtils:
 
         return output
 
+    def reuse_json_dumps(self,
+                         output: dict,
+                         tz: timezone,
+                         test_number: int,
+                         json_output_filepath: str,
+                         mail: str,
+                         flag: bool) -> dict:
+        """
+        Add to the json output the output of a check reused from a previous run, as customized_json_dumps does
+        with the output of a check just finished. The time of the check is kept.
+        """
+        json_output = self.read_output_json(json_output_filepath)
+
+        if self.generate_output_file:
+            output['jsonUrl'] = self.get_json_output_url(json_output, test_number)
+
+        json_output[test_number] = output
+        json_output["lastModifiedTime"] = self.get_now_verbose(tz, '%Y-%m-%dT%H:%M:%S%z')
+        self.update_output_json(json_output_filepath, json_output)
+
+        if self.generate_output_file:
+            self.send_message(test_number, mail, tz, check_type="passed" if flag else "failed",
+                              json_output=json_output)
+
+        return output
+
     @staticmethod
     def get_json_output_url(json_output, test_number):
         """
@@ -469,17 +511,24 @@ class SDMUtils:
     ################################################
     # To open json file when giving a url
     ################################################
-    @staticmethod
-    def open_json(file_url):
+    def fetch(self, url):
+        """
+        Download the url, through the run cache if there is one
+        """
+        if self.fetch_cache is not None:
+            return self.fetch_cache.get(url)
+        else:
+            return http_client.get(url)
+
+    def open_json(self, file_url):
         """
         TODO import the function from python package by "from pysmartdatamodel.utils import *"
         """
         import json
-        import requests
         if file_url[0:4] == "http":
             # it is a URL
             try:
-                pointer = requests.get(file_url)
+                pointer = self.fetch(file_url)
                 return json.loads(pointer.content.decode('utf-8'))
             except Exception as e:
                 print(e)
@@ -494,17 +543,19 @@ class SDMUtils:
                 print(e)
                 return None
 
-    @staticmethod
-    def open_jsonref(file_url):
+    def open_jsonref(self, file_url):
         """
         TODO: import the function from python package by "from pysmartdatamodel.utils import *"
         """
         if file_url[0:4] == "http":
             # is a URL
             try:
-                pointer = get(file_url)
-                output = jsonref_loads(pointer.content.decode('utf-8'), load_on_repr=False, merge_props=True)
-                return output
+                pointer = self.fetch(file_url)
+                output = jsonref_loads(pointer.content.decode('utf-8'),
+                                       loader=self.jsonref_loader,
+                                       load_on_repr=False,
+                                       merge_props=True)
+                return self.materialize_jsonref(output)
             except Exception as e:
                 print(e)
                 return ""
@@ -512,13 +563,79 @@ class SDMUtils:
             # is a file
             try:
                 with open(file_url, "r") as file:
-                    data = jsonref_loads(file.read())
-                return data
+                    data = jsonref_loads(file.read(), loader=self.jsonref_loader)
+                return self.materialize_jsonref(data)
             except Exception as e:
                 print(e)
                 print(file_url)
                 return ""
 
+    @staticmethod
+    def materialize_jsonref(document, max_depth=CONFIG_DATA.get("jsonref_max_depth", 100)):
+        """
+        Resolve once all the $ref of a document loaded with jsonref and copy it into plain dicts and lists,
+        so that the following parsers and validations do not go through the jsonref lazy proxies again.
+
+        A recursive $ref (a reference to one of its own ancestors) cannot be expanded into a tree, it is kept
+        as its jsonref proxy. Raise ValueError if the document is nested deeper than max_depth levels.
+        """
+        ancestors = set()
+
+        # resolved uris of the $ref being expanded. A $ref with sibling keywords (merge_props) resolves to a new
+        # dict each time, so its cycles are found by the uri of the referent and not by the identity of the dict
+        ref_ancestors = set()
+
+        def materialize(node, depth):
+            if depth > max_depth:
+                raise ValueError(f"The document exceeds the maximum depth of {max_depth} levels (too many $ref?)")
+
+            if isinstance(node, JsonRef):
+                uri = JsonRef.full_uri.fget(node)
+                if uri in ref_ancestors or id(node.__subject__) in ancestors:
+                    # cycle, keep the lazy reference
+                    return node
+
+                ref_ancestors.add(uri)
+                try:
+                    return materialize(node.__subject__, depth)
+                finally:
+                    ref_ancestors.discard(uri)
+
+            if isinstance(node, dict):
+                ancestors.add(id(node))
+                result = {key: materialize(value, depth + 1) for key, value in node.items()}
+                ancestors.discard(id(node))
+                return result
+            elif isinstance(node, list):
+                ancestors.add(id(node))
+                result = [materialize(value, depth + 1) for value in node]
+                ancestors.discard(id(node))
+                return result
+            else:
+                return node
+
+        return materialize(document, 0)
+
+    def jsonref_loader(self, uri, **kwargs):
+        """
+        Load the documents referenced by $ref from the process-wide store of referenced documents,
+        which downloads them only the first time
+        """
+        if uri[0:4] == "http":
+            # the document may be served by the store without being fetched in this run
+            if self.fetch_cache is not None:
+                self.fetch_cache.depend(uri)
+
+            document, digest = ref_store.load_entry(uri, fetch=self.fetch)
+
+            # the test read the document of the store, which may be older than the one fetched in this run
+            if self.fetch_cache is not None:
+                self.fetch_cache.depend(uri, digest=digest)
+
+            return document
+        else:
+            return jsonloader(uri, **kwargs)
+
     ################################################
     # URL related
     #
@@ -527,13 +644,12 @@ class SDMUtils:
     #   - create urls
     #   - extract subject, data models information from urls
     ################################################
-    @staticmethod
-    def is_url_existed(url):
+    def is_url_existed(self, url):
         """
         TODO: import the function from python package by "from pysmartdatamodel.utils import *"
         """
         try:
-            pointer = get(url)
+            pointer = self.fetch(url)
             if pointer.status_code == 200:
                 return [True, pointer.text]
             else:
@@ -542,6 +658,34 @@ class SDMUtils:
             print(e)
             return [False, "wrong domain"]
 
+    def is_url_reachable(self, url) -> bool:
+        """
+        Check with a HEAD request, without downloading the body, whether the url exists
+        """
+        try:
+            if self.fetch_cache is not None:
+                pointer = self.fetch_cache.head(url)
+            else:
+                pointer = http_client.head(url)
+
+            return pointer.status_code == 200
+        except Exception as e:
+            print(e)
+            return False
+
+    def are_urls_reachable(self, urls: list) -> list:
+        """
+        Check concurrently whether the urls exist, the result keeps the order of the urls
+        """
+        if len(urls) == 0:
+            return list()
+
+        # no more threads than connections to the same host in the pool of the HTTP client
+        max_workers = min(len(urls), CONFIG_DATA.get("http", dict()).get("pool_maxsize", 16))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.is_url_reachable, urls))
+
     def get_other_files_raw(self, repo_url, checking_file):
         """
         Generate the other files link, such as notes.yaml
@@ -1316,7 +1460,8 @@ class SDMUtils:
                          test="",
                          meta_schema="",
                          tag="",
-                         additional_properties=False):
+                         additional_properties=False,
+                         meta_validator=None):
 
         schema_dict = dict()
         yaml_dict = dict()
@@ -1544,7 +1689,11 @@ class SDMUtils:
 
             if schema_url.endswith("schema.json"):
                 try:
-                    validate(instance=schema, schema=meta_schema, format_checker=Draft202012Validator.FORMAT_CHECKER)
+                    # meta_validator is the precompiled validator of meta_schema, if provided
+                    if meta_validator is not None:
+                        meta_validator.validate(schema)
+                    else:
+                        validator_cache.validate(instance=schema, schema=meta_schema)
                 except ValidationError as err:
                     # print(err)
                     output["cause"] = f"{tag} does not validate as a json schema"
@@ -1561,40 +1710,6 @@ class SDMUtils:
                     return False
             else:
                 try:
-                    # Add additionalProperties
-                    if not additional_properties:
-                        # tmp_schema = {}
-                        # tmp_schema["type"] = "object"
-                        # tmp_schema["properties"] = {}
-                        # for idx in range(len(metaSchema["allOf"])):
-                        #     tmp_schema["properties"] = dict(tmp_schema["properties"],
-                        #                                     **metaSchema["allOf"][idx]["properties"])
-                        #
-                        # tmp_schema["additionalProperties"] = False
-                        # metaSchema["allOf"] = [tmp_schema]
-
-                        def flatten_all_of(my_schema):
-                            new_tmp_schema = dict()
-                            new_tmp_schema["properties"] = dict()
-                            for idx in range(len(my_schema["allOf"])):
-                                if "allOf" in my_schema["allOf"][idx]:
-                                    tmp_output = flatten_all_of(my_schema["allOf"][idx])
-                                    new_tmp_schema["properties"] = \
-                                        (dict(new_tmp_schema["properties"], **tmp_output["properties"]))
-
-                                if "properties" in my_schema["allOf"][idx]:
-                                    new_tmp_schema["properties"] = \
-                                        (dict(new_tmp_schema["properties"], **my_schema["allOf"][idx]["properties"]))
-
-                            return new_tmp_schema
-
-                        if "allOf" in meta_schema:
-                            tmp_schema = flatten_all_of(meta_schema)
-                            tmp_schema["additionalProperties"] = False
-                            meta_schema["allOf"] = [tmp_schema]
-                        elif "properties" in meta_schema:
-                            meta_schema["additionalProperties"] = False
-
                     if "example-normalized" in schema_url:
                         result = self.normalized2keyvalues_v2(schema, output, tz, test, json_output_filepath, mail)
 
@@ -1605,7 +1720,9 @@ class SDMUtils:
                     if "@context" in schema:
                         schema.pop("@context")
 
-                    validate(instance=schema, schema=meta_schema, format_checker=Draft202012Validator.FORMAT_CHECKER)
+                    # the closed variant of the schema (additionalProperties: False, unless additional_properties
+                    # are allowed) and its validator are built once and shared by all the examples
+                    validator_cache.validate(instance=schema, schema=meta_schema, closed=not additional_properties)
                 except ValidationError as err:
                     # print(err)
                     spacer = '\n'
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+from logging import getLogger
+from api.job_queue import SDMJobQueue, SUCCEEDED
+from api.jobs import JobManager
+from smartdatamodels.SDMEventBus import event_bus
+
+
+def test_channel_of_job_finished_by_another_process():
+    queue = SDMJobQueue(db_path=":memory:", max_attempts=2)
+    job_manager = JobManager(queue=queue, logger=getLogger(__name__))
+
+    job_id = queue.enqueue(data_model="https://github.com/smart-data-models/dataModel.A/tree/master/B",
+                           mail="someone@example.org", tests=1)
+
+    # the first attempt, run here, failed and the job was queued again
+    queue.claim("here-0")
+    queue.fail(job_id, "here-0", "timeout")
+    event_bus.channel(job_id).publish("retry", {"attempt": 1, "error": "timeout"})
+
+    received = list()
+    event_bus.subscribe(job_id, received.append)
+
+    job_manager.close_finished_channels()
+    assert received == list()
+
+    # the second attempt is run and completed by another process
+    queue.claim("there-0")
+    queue.complete(job_id, "there-0", {"1": {"result": True}})
+
+    job_manager.close_finished_channels()
+
+    assert [event["type"] for event in received] == ["end"]
+    assert received[0]["state"] == SUCCEEDED
+    assert job_id not in event_bus.open_channels()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+from json import dumps
+from jsonref import loads as jsonref_loads, JsonRef
+from smartdatamodels.utils import SDMUtils
+
+
+def test_recursive_ref_with_sibling_keywords():
+    schema = {
+        "definitions": {
+            "node": {
+                "type": "object",
+                "properties": {
+                    "child": {"$ref": "#/definitions/node", "description": "Property. The child node"}
+                }
+            }
+        },
+        "properties": {
+            "root": {"$ref": "#/definitions/node", "description": "Property. The root node"}
+        }
+    }
+
+    document = jsonref_loads(dumps(schema), base_uri="https://example.org/schema.json", load_on_repr=False,
+                             merge_props=True)
+
+    materialized = SDMUtils.materialize_jsonref(document)
+
+    root = materialized["properties"]["root"]
+    assert type(root) is dict
+    assert root["description"] == "Property. The root node"
+    assert root["type"] == "object"
+
+    # the recursive reference is kept as its lazy proxy instead of being expanded forever
+    assert isinstance(root["properties"]["child"], JsonRef)
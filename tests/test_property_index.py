@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+from io import StringIO
+from smartdatamodels.SDMPropertyIndex import SDMPropertyIndex, iter_json_array
+
+
+def test_list_typed_property():
+    index = SDMPropertyIndex([
+        {"property": "p", "dataModel": "A", "description": "first", "type": ["string", "null"]},
+        {"property": "p", "dataModel": "B", "description": "second", "type": ["string", "null"]},
+        {"property": "q", "dataModel": "A", "description": "other", "type": "number"}
+    ])
+
+    entries = index.lookup("p")
+
+    assert entries.data_models == ["A", "B"]
+    assert entries.types == [str(["string", "null"])] * 2
+    assert entries.distinct_types == [str(["string", "null"])]
+    assert index.lookup("q").types == ["number"]
+
+
+def test_iter_json_array_leading_whitespace():
+    reader = StringIO('\n\n  \t[ {"property": "p", "dataModel": "A", "extra": 1} ,\n {"property": "q"} ]')
+
+    items = list(iter_json_array(reader, keys=["property", "dataModel"], chunk_size=1))
+
+    assert items == [{"property": "p", "dataModel": "A"}, {"property": "q"}]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2024 FIWARE Foundation, e.V.
+#
+# This file is part of SDM Quality Testing
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+
+from json import dumps
+from smartdatamodels.SDMResultCache import SDMResultCache
+
+DATA_MODEL = "https://github.com/smart-data-models/dataModel.Weather/tree/master/WeatherObserved"
+SCHEMA_URL = "https://raw.githubusercontent.com/smart-data-models/dataModel.Weather/master/WeatherObserved/schema.json"
+
+
+class FetchCache:
+    """
+    Digests of files which never change
+    """
+    @staticmethod
+    def digest(url: str, method: str = "GET") -> str:
+        return f"{method} {url}"
+
+
+def output_for(mail: str) -> dict:
+    return {
+        "result": False,
+        "cause": f"The schema could not be validated for {mail}",
+        "parameters": {"schemaUrl": SCHEMA_URL, "mail": mail, "test": "Schema check"},
+        "jsonUrl": f"https://smartdatamodels.org/extra/get_test_json_output.php?mail={mail}&date=2024-01-01"
+    }
+
+
+def test_cached_output_of_another_requester(tmp_path):
+    cache = SDMResultCache(db_path=str(tmp_path / "results.sqlite"))
+
+    cache.store(data_model=DATA_MODEL, test_number=2, result=False, output=output_for("alice@example.org"),
+                dependencies={("GET", SCHEMA_URL): None}, fetch_cache=FetchCache(), mail="alice@example.org")
+
+    result, output = cache.lookup(data_model=DATA_MODEL, test_number=2, fetch_cache=FetchCache(),
+                                  mail="bob@example.org")
+
+    assert result is False
+    assert "alice" not in dumps(output)
+    assert output["parameters"]["mail"] == "bob@example.org"
+    assert output["cause"] == "The schema could not be validated for bob@example.org"
+    # the link to the output file is created again for each requester
+    assert "jsonUrl" not in output
+
+    cache.close()
+
+
+def test_result_computed_with_an_outdated_ref_document(tmp_path):
+    cache = SDMResultCache(db_path=str(tmp_path / "results.sqlite"))
+    ref_url = "https://smart-data-models.github.io/data-models/common-schema.json"
+
+    # the ref store served an older common-schema.json than the one downloaded now
+    cache.store(data_model=DATA_MODEL, test_number=2, result=True, output={"result": True},
+                dependencies={("GET", SCHEMA_URL): None, ("GET", ref_url): "outdated"},
+                fetch_cache=FetchCache(), mail="alice@example.org")
+
+    assert cache.lookup(data_model=DATA_MODEL, test_number=2, fetch_cache=FetchCache(),
+                        mail="bob@example.org") is None
+
+    cache.store(data_model=DATA_MODEL, test_number=2, result=True, output={"result": True},
+                dependencies={("GET", SCHEMA_URL): None, ("GET", ref_url): FetchCache.digest(ref_url)},
+                fetch_cache=FetchCache(), mail="alice@example.org")
+
+    assert cache.lookup(data_model=DATA_MODEL, test_number=2, fetch_cache=FetchCache(),
+                        mail="bob@example.org") == (True, {"result": True})
+
+    cache.close()